@@ -4,50 +4,145 @@
 # ==============================================================================
 
 import os
+import csv
 import json
+import heapq
+import random
+import cProfile
+import itertools
+import functools
+import base64
+import hashlib
+import hmac
+import time
+import atexit
 import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+import sqlite3
+import threading
+import click
+from concurrent.futures import ProcessPoolExecutor
+from flask import Flask, Response, render_template, request, redirect, url_for, session, jsonify, g, get_template_attribute, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
-from sqlalchemy import desc, func
-from collections import deque
+from markupsafe import Markup
+from sqlalchemy import Engine, and_, desc, func, select, update, delete, event, inspect, text, or_, tuple_, union_all, literal, cast
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session, contains_eager, joinedload, object_session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from collections import deque, defaultdict, namedtuple, Counter, OrderedDict
 
 # ----------------- App Initialization & Configuration -----------------
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'the_ultimate_secret_key_for_dsa_project_v12_final'
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'gym.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'gym.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Connection pool; ignored for in-memory SQLite. Each worker process gets its own pool.
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 30))  # seconds to wait for a free connection
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # seconds; stay under server idle timeouts
+app.config['DB_STATEMENT_TIMEOUT'] = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))  # ms, PostgreSQL only; 0 disables
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # ms a writer waits for the lock
+app.config['SQLITE_WAL'] = os.environ.get('SQLITE_WAL', '1') == '1'  # readers no longer block the writer (and vice versa)
+app.config['BOOKING_LOCK_RETRIES'] = 5  # retries when a write transaction hits a locked database
+app.config['ACTIVITY_LOG_ASYNC'] = True  # buffer ActivityLog rows and bulk insert them on a background thread
+app.config['ACTIVITY_LOG_BATCH_SIZE'] = 200
+app.config['ACTIVITY_LOG_FLUSH_INTERVAL'] = 0.5  # seconds
+app.config['ACTIVITY_FEED_SIZE'] = 1000  # events kept in the in-memory ring buffer behind /api/activity_stream
+app.config['ACTIVITY_FEED_POLL_INTERVAL'] = 2.0  # seconds between checks for rows committed by other processes
+app.config['ACTIVITY_FEED_KEEPALIVE'] = 15.0  # seconds
+app.config['ACTIVITY_STREAM_MAX_AGE'] = float(os.environ.get('ACTIVITY_STREAM_MAX_AGE', 300))  # seconds before a stream closes and EventSource reconnects
+app.config['ACTIVITY_FEED_REORDER_WINDOW'] = 200  # ids below the newest seen row that are re-read for late commits
+app.config['AUTH_CACHE_SIZE'] = 10000  # signed-in identities kept in the per-process LRU cache
+app.config['AUTH_CACHE_TTL'] = 60  # seconds; bounds staleness of role/name changes made by other processes
+app.config['DASHBOARD_CACHE_TTL'] = 300  # seconds; safety net for writes made by other processes
+app.config['CLASS_CATALOG_TTL'] = 300  # seconds; class edits made by other processes show up within this window
+app.config['ROLLUP_FOLD_INTERVAL'] = 5.0  # seconds between moves of RollupDelta rows into MonthlyRollup
+app.config['PROFILING_ENABLED'] = os.environ.get('GYM_PROFILING', '0') == '1'  # per-endpoint timings and SQL counts
+app.config['PROFILING_SLOW_STATEMENTS'] = 5  # slowest statements kept per endpoint
+app.config['PROFILING_SAMPLE_RATE'] = float(os.environ.get('GYM_PROFILE_SAMPLE_RATE', 0))  # share of requests run under cProfile
+app.config['PROFILING_DUMP_DIR'] = os.path.join(basedir, 'profiles')
+app.config['METRICS_TOKEN'] = os.environ.get('GYM_METRICS_TOKEN')  # bearer token for scrapers; admins can always read metrics
+# Cold-cache SQL statements per request, enforced by `flask check-query-budgets`; none may grow with the data
+app.config['QUERY_BUDGETS'] = {'member_dashboard': 3, 'trainer_dashboard': 5, 'admin_dashboard': 4, 'admin_view_user': 6,
+                               'view_client': 6, 'class_booking': 2, 'api_book_class': 8, 'api_cancel_booking': 11}
 app.permanent_session_lifetime = datetime.timedelta(days=7)
+app.config.from_envvar('GYM_SETTINGS', silent=True)  # optional Python file overriding any of the above
+
+def engine_options(config):
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    if uri.startswith('postgres://'):  # scheme used by some hosting providers, rejected by SQLAlchemy
+        uri = config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://' + uri[len('postgres://'):]
+    if uri.startswith('sqlite') and (uri in ('sqlite://', 'sqlite:///') or ':memory:' in uri):
+        return {}
+    options = {'pool_size': config['DB_POOL_SIZE'], 'max_overflow': config['DB_MAX_OVERFLOW'],
+               'pool_timeout': config['DB_POOL_TIMEOUT'], 'pool_recycle': config['DB_POOL_RECYCLE'], 'pool_pre_ping': True}
+    if uri.startswith('postgresql') and config['DB_STATEMENT_TIMEOUT']:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"}
+    return options
+
+app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
 
 # ----------------- Extensions & Custom Filters -----------------
 db = SQLAlchemy(app)
 bcrypt = Bcrypt(app)
 
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection): return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT'])}")
+    if app.config['SQLITE_WAL']:
+        # WAL is persistent in the database file; NORMAL sync is durable across app crashes in WAL mode
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.close()
+
+def _dispose_inherited_pools():
+    # Pooled connections must not be shared with a forked worker (gunicorn --preload)
+    with app.app_context():
+        for engine in db.engines.values(): engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=_dispose_inherited_pools)
+
 # ----------------- DATABASE MODELS -----------------
 trainer_client_association = db.Table('trainer_client',
     db.Column('trainer_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
-    db.Column('client_id', db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    db.Column('client_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
+    db.Index('ix_trainer_client_client', 'client_id')
 )
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (db.Index('ix_users_role_name', 'role', 'name'),)
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     password = db.Column(db.String(100), nullable=False)
     role = db.Column(db.String(20), nullable=False)
     goal = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     # Relationships
     weight_logs = db.relationship('WeightLog', backref='user', lazy=True, cascade="all, delete-orphan")
     bookings = db.relationship('Booking', backref='member', lazy='dynamic', cascade="all, delete-orphan")
     waitlist_entries = db.relationship('Waitlist', backref='member', lazy='dynamic', cascade="all, delete-orphan")
     workout_plans = db.relationship('WorkoutPlan', backref='member', lazy='dynamic', cascade="all, delete-orphan")
+    memberships = db.relationship('Membership', backref='member', lazy='dynamic', cascade="all, delete-orphan")
+    measurements = db.relationship('Measurement', backref='user', lazy='dynamic', cascade="all, delete-orphan")
+    payments = db.relationship('Payment', backref='payer', lazy='dynamic')  # kept (user_id nulled) when a user is removed
     clients = db.relationship('User', secondary=trainer_client_association,
                               primaryjoin=(trainer_client_association.c.trainer_id == id),
                               secondaryjoin=(trainer_client_association.c.client_id == id),
                               backref=db.backref('assigned_trainer', lazy='dynamic'), lazy='dynamic')
 
+# Case-insensitive prefix search of the user directory (see prefix_match); text_pattern_ops lets
+# PostgreSQL serve LIKE 'abc%' from the index under any collation
+for _column in (User.name, User.email):
+    db.Index(f'ix_users_{_column.key}_lower', func.lower(_column).label(f'{_column.key}_lower'),
+             postgresql_ops={f'{_column.key}_lower': 'text_pattern_ops'})
+
 class Class(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -57,10 +152,17 @@ class Class(db.Model):
     duration = db.Column(db.String(50), nullable=False)
     image_url = db.Column(db.String(255), nullable=False)
     capacity = db.Column(db.Integer, nullable=False, default=3)
+    booked_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # maintained by the booking engine
     bookings = db.relationship('Booking', backref='class_info', lazy='dynamic', cascade="all, delete-orphan")
     waitlist_entries = db.relationship('Waitlist', backref='class_info', lazy='dynamic', cascade="all, delete-orphan")
 
 class Booking(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'class_id', name='uq_booking_user_class'),
+        db.Index('ix_booking_user_date', 'user_id', 'booking_date'),
+        db.Index('ix_booking_user_status', 'user_id', 'status'),
+        db.Index('ix_booking_class_status', 'class_id', 'status'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
@@ -68,12 +170,17 @@ class Booking(db.Model):
     status = db.Column(db.String(20), default='BOOKED', nullable=False)
 
 class Waitlist(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'class_id', name='uq_waitlist_user_class'),
+        db.Index('ix_waitlist_class_timestamp', 'class_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
 
 class WorkoutPlan(db.Model):
+    __table_args__ = (db.Index('ix_workout_plan_member_date', 'member_id', 'assigned_date'),)
     id = db.Column(db.Integer, primary_key=True)
     member_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     trainer_name = db.Column(db.String(100), nullable=False)
@@ -82,20 +189,126 @@ class WorkoutPlan(db.Model):
     assigned_date = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
 class WeightLog(db.Model):
+    __table_args__ = (db.Index('ix_weight_log_user_date', 'user_id', 'date'),)
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.date.today)
     weight_lb = db.Column(db.Float, nullable=False)
 
+class Measurement(db.Model):
+    # Body measurements logged from the BMI calculator; bmi is derived on write when a height is known
+    __table_args__ = (db.Index('ix_measurement_user_taken_at', 'user_id', 'taken_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    weight_kg = db.Column(db.Float, nullable=False)
+    height_m = db.Column(db.Float)
+    bmi = db.Column(db.Float)
+
 class ActivityLog(db.Model):
+    __table_args__ = (
+        db.Index('ix_activity_log_timestamp', 'timestamp'),
+        db.Index('ix_activity_log_user_name_timestamp', 'user_name', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer)  # actor; not a foreign key so the log outlives removed users
     user_name = db.Column(db.String(100), nullable=False)
     message = db.Column(db.String(255), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+class Membership(db.Model):
+    __table_args__ = (db.Index('ix_membership_user_expires', 'user_id', 'expires_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    plan = db.Column(db.String(50), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    payments = db.relationship('Payment', backref='membership', lazy='dynamic')
+
+class Payment(db.Model):
+    __table_args__ = (db.Index('ix_payment_paid_at', 'paid_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    membership_id = db.Column(db.Integer, db.ForeignKey('membership.id'))
+    amount_cents = db.Column(db.Integer, nullable=False)
+    description = db.Column(db.String(255), nullable=False)
+    paid_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+class MonthlyRollup(db.Model):
+    # One row per (month, class); class_id 0 holds the gym-wide totals. Maintained incrementally by the analytics engine.
+    __table_args__ = (
+        db.UniqueConstraint('month', 'class_id', name='uq_monthly_rollup_month_class'),
+        db.Index('ix_monthly_rollup_class_month', 'class_id', 'month'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    class_id = db.Column(db.Integer, nullable=False, default=0)
+    revenue_cents = db.Column(db.Integer, nullable=False, default=0)
+    signups = db.Column(db.Integer, nullable=False, default=0)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    attendance = db.Column(db.Integer, nullable=False, default=0)
+
+class RollupDelta(db.Model):
+    # Append-only rollup changes not yet folded into MonthlyRollup; one row per event, so concurrent writers never share a row
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False)
+    class_id = db.Column(db.Integer, nullable=False, default=0)
+    revenue_cents = db.Column(db.Integer, nullable=False, default=0)
+    signups = db.Column(db.Integer, nullable=False, default=0)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    attendance = db.Column(db.Integer, nullable=False, default=0)
+
+class RemovedAccountRollup(db.Model):
+    # Signups, bookings and attendance of removed accounts, whose rows are gone; backfill_rollups adds them back
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False)
+    class_id = db.Column(db.Integer, nullable=False, default=0)
+    signups = db.Column(db.Integer, nullable=False, default=0)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    attendance = db.Column(db.Integer, nullable=False, default=0)
+
+class ImportJob(db.Model):
+    # Progress of a `flask import-data` run, committed together with each batch so an interrupted import resumes exactly
+    __table_args__ = (db.UniqueConstraint('entity', 'source', name='uq_import_job_entity_source'),)
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(30), nullable=False)
+    source = db.Column(db.String(500), nullable=False)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
 # ----------------- HELPER FUNCTIONS -----------------
 def get_current_user():
-    return User.query.get(session.get('user_id')) if 'user_id' in session else None
+    identity = get_current_identity()
+    if not identity: return None
+    user = User.query.get(identity.id)
+    if user is None:
+        # Deleted by another worker while this one still had the identity cached: sign the session out
+        identity_cache.invalidate([identity.id]); g.identity = None; session.clear()
+    return user
+
+def day_bounds(day):
+    # [start, end) datetimes for a calendar day, so date filters stay sargable on DateTime columns
+    start = datetime.datetime.combine(day, datetime.time.min)
+    return start, start + datetime.timedelta(days=1)
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+
+def like_prefix(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def prefix_match(column, term):
+    # Case-insensitive "starts with" that an index on lower(column) can serve: LIKE on PostgreSQL,
+    # a range on SQLite (whose LIKE optimization ignores expression indexes)
+    lowered = func.lower(column)
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql': return lowered.like(like_prefix(term.lower()), escape='\\')
+    if dialect == 'sqlite': return and_(lowered >= func.lower(term), lowered < func.lower(term + '\U0010ffff'))
+    return column.ilike(like_prefix(term), escape='\\')
 
 def time_ago(date):
     if not date: return "never"
@@ -104,8 +317,1274 @@ def time_ago(date):
     if diff.seconds > 3600: return f"{diff.seconds // 3600}h ago"
     return f"{diff.seconds // 60}m ago" if diff.seconds > 60 else "just now"
 
-def log_activity(user_name, message):
-    db.session.add(ActivityLog(user_name=user_name, message=message))
+def log_activity(user_name, message, user_id=None):
+    entry = {'user_id': user_id, 'user_name': user_name, 'message': message, 'timestamp': datetime.datetime.utcnow()}
+    if not app.config['ACTIVITY_LOG_ASYNC']:
+        db.session.add(ActivityLog(**entry))
+    # Handed to the background writer (async mode) and the live feed once the surrounding transaction commits
+    db.session.info.setdefault('pending_activity', []).append(entry)
+
+# ----------------- AUTH CONTEXT -----------------
+# The signed-in user is resolved once per request (memoised on flask.g) to a small Identity
+# served from a TTL/LRU cache; commits that update or delete a user evict it.
+Identity = namedtuple('Identity', 'id role name')
+
+class IdentityCache:
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None: return None
+            identity, cached_at = entry
+            if time.monotonic() - cached_at > self.app.config['AUTH_CACHE_TTL']:
+                del self.entries[user_id]; return None
+            self.entries.move_to_end(user_id)
+            return identity
+
+    def put(self, identity):
+        with self.lock:
+            self.entries[identity.id] = (identity, time.monotonic()); self.entries.move_to_end(identity.id)
+            while len(self.entries) > self.app.config['AUTH_CACHE_SIZE']: self.entries.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        with self.lock:
+            for user_id in user_ids: self.entries.pop(user_id, None)
+
+identity_cache = IdentityCache(app)
+
+def get_current_identity():
+    if 'identity' in g: return g.identity
+    identity = None
+    user_id = session.get('user_id')
+    if user_id is not None:
+        identity = identity_cache.get(user_id)
+        if identity is None:
+            row = db.session.query(User.id, User.role, User.name).filter(User.id == user_id).first()
+            if row: identity = Identity(*row); identity_cache.put(identity)
+    g.identity = identity
+    return identity
+
+def role_required(*roles, denied='redirect'):
+    # denied: 'redirect' (to the landing page), 'forbidden' (plain 403) or 'json' (401/403 JSON for the JS API)
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped(*args, **kwargs):
+            identity = get_current_identity()
+            if identity and (not roles or identity.role in roles):
+                return view(*args, **kwargs)
+            if denied == 'json':
+                if not identity: return jsonify({'success': False, 'message': 'Not logged in'}), 401
+                return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+            if denied == 'forbidden': return "Unauthorized", 403
+            return redirect(url_for('home'))
+        return wrapped
+    return decorator
+
+login_required = role_required()
+
+def is_trainer_of(trainer_id, client_id):
+    return db.session.query(select(trainer_client_association.c.client_id).where(
+        trainer_client_association.c.trainer_id == trainer_id, trainer_client_association.c.client_id == client_id).exists()).scalar()
+
+@event.listens_for(Session, 'after_flush')
+def _collect_identity_writes(session, flush_context):
+    changed = [obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User)]
+    if changed: session.info.setdefault('identity_user_ids', set()).update(changed)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_identity_invalidations(session):
+    user_ids = session.info.pop('identity_user_ids', None)
+    if user_ids: identity_cache.invalidate(user_ids)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_identity_invalidations(session):
+    session.info.pop('identity_user_ids', None)
+
+# ----------------- TRAINER DASHBOARD DATA LAYER -----------------
+# Aggregates for a trainer's whole client list are computed with a fixed number of grouped
+# queries (independent of the number of clients) and cached per trainer. Commits that touch
+# Booking or WorkoutPlan rows of a cached client drop that trainer's entry.
+_trainer_dashboard_cache = {}
+_trainer_dashboard_lock = threading.Lock()
+_trainer_dashboard_generation = 0  # bumped on invalidation so a compute racing a commit is not stored
+
+def _client_ids_of(trainer_id):
+    return select(trainer_client_association.c.client_id).where(trainer_client_association.c.trainer_id == trainer_id)
+
+def _trainer_dashboard_queries(trainer_id):
+    client_ids = _client_ids_of(trainer_id)
+    today_start, _ = day_bounds(datetime.date.today())
+    return {
+        'last_booking': db.session.query(Booking.user_id, func.max(Booking.booking_date))
+                        .filter(Booking.user_id.in_(client_ids)).group_by(Booking.user_id),
+        'upcoming_classes': db.session.query(func.count(func.distinct(Booking.class_id)))
+                            .filter(Booking.user_id.in_(client_ids), Booking.booking_date >= today_start),
+        'training_plans': db.session.query(func.count(WorkoutPlan.id)).filter(WorkoutPlan.member_id.in_(client_ids)),
+    }
+
+def _compute_trainer_dashboard(trainer_id):
+    queries = _trainer_dashboard_queries(trainer_id)
+    return {'last_booking': dict(queries['last_booking'].all()),
+            'upcoming_classes': queries['upcoming_classes'].scalar() or 0,
+            'training_plans': queries['training_plans'].scalar() or 0}
+
+def get_trainer_dashboard_data(trainer_id, clients):
+    client_ids = frozenset(c.id for c in clients)
+    now = time.monotonic()
+    with _trainer_dashboard_lock:
+        entry, generation = _trainer_dashboard_cache.get(trainer_id), _trainer_dashboard_generation
+    # A changed client list (new signup, removed member) or an expired entry forces a recompute
+    if entry and entry['client_ids'] == client_ids and now - entry['computed_at'] < app.config['DASHBOARD_CACHE_TTL']:
+        return entry['data']
+    data = _compute_trainer_dashboard(trainer_id)
+    with _trainer_dashboard_lock:
+        if generation == _trainer_dashboard_generation:
+            _trainer_dashboard_cache[trainer_id] = {'client_ids': client_ids, 'computed_at': now, 'data': data}
+    return data
+
+def invalidate_trainer_dashboards(user_ids=None):
+    # Drops the entries of trainers coaching any of user_ids (every entry when None)
+    global _trainer_dashboard_generation
+    with _trainer_dashboard_lock:
+        _trainer_dashboard_generation += 1
+        for trainer_id, entry in list(_trainer_dashboard_cache.items()):
+            if user_ids is None or entry['client_ids'] & set(user_ids):
+                del _trainer_dashboard_cache[trainer_id]
+
+@event.listens_for(Session, 'after_flush')
+def _collect_dashboard_writes(session, flush_context):
+    user_ids = session.info.setdefault('dashboard_user_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Booking): user_ids.add(obj.user_id)
+        elif isinstance(obj, WorkoutPlan): user_ids.add(obj.member_id)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_dashboard_invalidations(session):
+    user_ids = session.info.pop('dashboard_user_ids', None)
+    if user_ids: invalidate_trainer_dashboards(user_ids)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_dashboard_invalidations(session):
+    session.info.pop('dashboard_user_ids', None)
+
+# ----------------- CLASS CATALOG CACHE -----------------
+# The class list changes rarely, so its JSON form and the rendered class grids are built once
+# per catalog version and served with an ETag (a hash of the catalog) and Last-Modified.
+# Commits that add, remove or edit a Class drop the cached version. Seat counters are live
+# data: they are never part of the catalog and come from /api/classes/availability instead.
+CLASS_IMAGES = {'Kickboxing': 'kickboxing.jpg', 'Zumba': 'zumba.jpg', 'Pilates': 'pilates.jpg', 'Spinning': 'Spinning.jpg'}
+_CATALOG_FIELDS = ('id', 'name', 'description', 'day', 'time', 'duration', 'capacity', 'image_url')
+
+class ClassCatalog:
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.lock = threading.Lock()
+        self.entry = None
+        self.generation = 0  # bumped on invalidation so a build racing a commit is not stored
+
+    def _build(self, previous):
+        classes = [{field: getattr(c, field) for field in _CATALOG_FIELDS} for c in Class.query.order_by(Class.id)]
+        for c in classes:
+            image = CLASS_IMAGES.get(c['name'])
+            c['image'] = url_for('static', filename=image) if image else c['image_url']
+        body = json.dumps(classes, sort_keys=True)
+        etag = hashlib.sha1(body.encode()).hexdigest()
+        if previous and previous['etag'] == etag:
+            # Expired but unchanged: keep the rendered fragments and the original Last-Modified
+            return dict(previous, built_at=time.monotonic())
+        return {'etag': etag, 'last_modified': datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0),
+                'classes': classes, 'json': body, 'fragments': {}, 'built_at': time.monotonic()}
+
+    def get(self):
+        with self.lock:
+            entry, generation = self.entry, self.generation
+        if entry and time.monotonic() - entry['built_at'] < self.app.config['CLASS_CATALOG_TTL']:
+            return entry
+        entry = self._build(entry)
+        with self.lock:
+            if generation == self.generation: self.entry = entry
+        return entry
+
+    def fragment(self, macro):
+        # Renders one of the class grid macros in _macros.html once per catalog version
+        entry = self.get()
+        html = entry['fragments'].get(macro)
+        if html is None:
+            html = entry['fragments'][macro] = Markup(get_template_attribute('_macros.html', macro)(entry['classes']))
+        return entry, html
+
+    def invalidate(self):
+        with self.lock:
+            self.entry = None; self.generation += 1
+
+class_catalog = ClassCatalog(app)
+
+def catalog_response(response, entry):
+    # Clients must revalidate every time, but an unchanged catalog costs them a 304 with no body
+    response.set_etag(entry['etag'])
+    response.last_modified = entry['last_modified']
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@event.listens_for(Session, 'after_flush')
+def _collect_catalog_writes(session, flush_context):
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, Class): continue
+        state = inspect(obj)
+        # booked_count moves with every booking and is not part of the catalog
+        if obj in session.new or obj in session.deleted or any(state.attrs[f].history.has_changes() for f in _CATALOG_FIELDS):
+            session.info['catalog_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _apply_catalog_invalidation(session):
+    if session.info.pop('catalog_changed', False): class_catalog.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_invalidation(session):
+    session.info.pop('catalog_changed', None)
+
+# ----------------- ACTIVITY LOG WRITER -----------------
+# Committed log_activity() entries are queued in memory and written by a daemon thread with
+# one bulk INSERT per batch (ACTIVITY_LOG_BATCH_SIZE rows or every ACTIVITY_LOG_FLUSH_INTERVAL
+# seconds), keeping them out of the request transactions. Remaining entries are written at exit.
+class ActivityLogWriter:
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.buffer = deque()
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.thread = None
+        self.pid = None
+        self.stopping = False
+
+    def submit(self, entries):
+        with self.cond:
+            self.buffer.extend(entries)
+            # Started lazily (and again after a fork) so pre-forking servers get a writer per worker
+            if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+                self.pid = os.getpid(); self.stopping = False
+                self.thread = threading.Thread(target=self._run, name='activity-log-writer', daemon=True)
+                self.thread.start()
+            if len(self.buffer) >= self.app.config['ACTIVITY_LOG_BATCH_SIZE']: self.cond.notify_all()
+
+    def _take_batch(self):
+        batch_size = self.app.config['ACTIVITY_LOG_BATCH_SIZE']
+        batch = [self.buffer.popleft() for _ in range(min(batch_size, len(self.buffer)))]
+        self.in_flight += len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if not self.buffer and not self.stopping:
+                    self.cond.wait(self.app.config['ACTIVITY_LOG_FLUSH_INTERVAL'])
+                if self.buffer and len(self.buffer) < self.app.config['ACTIVITY_LOG_BATCH_SIZE'] and not self.stopping:
+                    self.cond.wait(self.app.config['ACTIVITY_LOG_FLUSH_INTERVAL'])
+                if not self.buffer and self.stopping: return
+                batch = self._take_batch()
+            if batch: self._write(batch)
+
+    def _write(self, batch):
+        try:
+            with self.app.app_context():
+                for attempt in range(self.app.config['BOOKING_LOCK_RETRIES']):
+                    try:
+                        db.session.execute(ActivityLog.__table__.insert(), batch); db.session.commit(); break
+                    except OperationalError:
+                        db.session.rollback()
+                        if attempt == self.app.config['BOOKING_LOCK_RETRIES'] - 1: raise
+                        time.sleep(0.05 * (attempt + 1))
+            activity_feed.notify()
+        except Exception:
+            self.app.logger.exception("Dropped %d activity log entries", len(batch))
+        finally:
+            with self.cond:
+                self.in_flight -= len(batch); self.cond.notify_all()
+
+    def flush(self, timeout=10.0):
+        # Blocks until everything submitted so far has been written (or the timeout passes)
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            self.cond.notify_all()
+            while (self.buffer or self.in_flight) and self.thread and self.thread.is_alive() and time.monotonic() < deadline:
+                self.cond.wait(0.05); self.cond.notify_all()
+        while True:
+            with self.cond:
+                leftover = self._take_batch() if self.buffer else []
+            if not leftover: return
+            self._write(leftover)
+
+    def stop(self):
+        with self.cond:
+            self.stopping = True; self.cond.notify_all()
+        if self.thread and self.pid == os.getpid(): self.thread.join(timeout=10.0)
+        self.flush(timeout=0)
+
+activity_log_writer = ActivityLogWriter(app)
+atexit.register(activity_log_writer.stop)
+
+@event.listens_for(Session, 'after_commit')
+def _dispatch_pending_activity(session):
+    entries = session.info.pop('pending_activity', None)
+    if not entries: return
+    if app.config['ACTIVITY_LOG_ASYNC']: activity_log_writer.submit(entries)
+    else: activity_feed.notify()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_activity(session):
+    session.info.pop('pending_activity', None)
+
+# ----------------- LIVE ACTIVITY FEED -----------------
+# One tailer thread per process follows ActivityLog by id into a bounded ring buffer and wakes
+# every open /api/activity_stream connection, so idle dashboards never query the database
+# themselves. Local commits wake the tailer immediately; rows written by other worker
+# processes are picked up within ACTIVITY_FEED_POLL_INTERVAL. It stops when nobody listens.
+# Ids are handed out before commit (PostgreSQL sequences), so a row can become visible after a
+# higher id: each poll re-reads ACTIVITY_FEED_REORDER_WINDOW ids below the newest one and skips
+# the ids it has seen. Buffered events carry a delivery sequence number that streams follow.
+class ActivityFeed:
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.events = deque(maxlen=flask_app.config['ACTIVITY_FEED_SIZE'])
+        self.cond = threading.Condition()
+        self.wake = threading.Event()
+        self.last_id = None
+        self.seen_ids = set()
+        self.seq = 0
+        self.subscribers = 0
+        self.thread = None
+        self.pid = None
+
+    def notify(self):
+        self.wake.set()
+
+    def subscribe(self):
+        with self.cond:
+            self.subscribers += 1
+            if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, name='activity-feed', daemon=True)
+                self.thread.start()
+            # Block until the buffer is primed so new subscribers get a backlog
+            self.cond.wait_for(lambda: self.last_id is not None, timeout=5.0)
+
+    def unsubscribe(self):
+        with self.cond:
+            self.subscribers -= 1
+
+    def _poll(self):
+        with self.app.app_context():
+            query = db.session.query(ActivityLog.id, ActivityLog.user_id, ActivityLog.user_name, ActivityLog.message, ActivityLog.timestamp)
+            window = self.app.config['ACTIVITY_FEED_REORDER_WINDOW']
+            if self.last_id is None:
+                rows = query.order_by(desc(ActivityLog.id)).limit(self.events.maxlen).all()[::-1]
+            else:
+                rows = query.filter(ActivityLog.id > self.last_id - window).order_by(ActivityLog.id).limit(self.events.maxlen + window).all()
+        with self.cond:
+            for r in rows:
+                if r.id in self.seen_ids: continue
+                self.seq += 1
+                self.events.append({'seq': self.seq, 'id': r.id, 'user_id': r.user_id, 'user': r.user_name, 'action': r.message, 'timestamp': r.timestamp})
+            self.last_id = max([self.last_id or 0] + [r.id for r in rows])
+            self.seen_ids = {i for i in self.seen_ids.union(r.id for r in rows) if i > self.last_id - window}
+            self.cond.notify_all()
+
+    def _run(self):
+        while True:
+            try:
+                self._poll()
+            except Exception:
+                self.app.logger.exception("Activity feed poll failed")
+            self.wake.wait(self.app.config['ACTIVITY_FEED_POLL_INTERVAL']); self.wake.clear()
+            with self.cond:
+                if not self.subscribers:
+                    self.thread = None; self.last_id = None; self.seen_ids.clear(); self.events.clear()
+                    return
+
+    def wait_for_events(self, after_seq, timeout):
+        with self.cond:
+            self.cond.wait_for(lambda: self.events and self.events[-1]['seq'] > after_seq, timeout=timeout)
+            return [e for e in self.events if e['seq'] > after_seq]
+
+activity_feed = ActivityFeed(app)
+
+def format_activity_event(entry):
+    payload = {'id': entry['id'], 'user': entry['user'], 'action': entry['action'],
+               'timestamp': entry['timestamp'].isoformat() if entry['timestamp'] else None, 'time': time_ago(entry['timestamp'])}
+    return f"id: {entry['id']}\nevent: activity\ndata: {json.dumps(payload)}\n\n"
+
+# ----------------- BOOKING ENGINE -----------------
+# Class.booked_count mirrors the number of Booking rows of a class. Every Booking insert claims
+# a seat with a conditional UPDATE (only succeeds while booked_count < capacity) and every
+# delete releases one, so the capacity check and the insert share one atomic transaction.
+class ClassFullError(Exception):
+    pass
+
+_class_table = Class.__table__
+
+@event.listens_for(Booking, 'before_insert')
+def _claim_seat(mapper, connection, target):
+    claimed = connection.execute(update(_class_table).where(
+        _class_table.c.id == target.class_id, _class_table.c.booked_count < _class_table.c.capacity
+    ).values(booked_count=_class_table.c.booked_count + 1)).rowcount
+    if not claimed: raise ClassFullError(target.class_id)
+
+@event.listens_for(Booking, 'after_delete')
+def _release_seat(mapper, connection, target):
+    connection.execute(update(_class_table).where(_class_table.c.id == target.class_id)
+                       .values(booked_count=_class_table.c.booked_count - 1))
+
+def resync_seat_counters():
+    counts = select(func.count(Booking.id)).where(Booking.class_id == _class_table.c.id).scalar_subquery()
+    db.session.execute(update(_class_table).values(booked_count=counts))
+
+def _with_lock_retries(txn):
+    # SQLite reports write-lock contention as OperationalError; the whole transaction is replayed
+    for attempt in range(app.config['BOOKING_LOCK_RETRIES']):
+        try:
+            return txn()
+        except OperationalError as e:
+            db.session.rollback()
+            if 'locked' not in str(e.orig).lower() or attempt == app.config['BOOKING_LOCK_RETRIES'] - 1: raise
+            time.sleep(0.01 * (attempt + 1))
+
+def book_class(user_id, user_name, class_id):
+    target_class = Class.query.get(class_id)
+    if not target_class: return {'success': False, 'message': 'Class not found'}, 404
+    class_name = target_class.name
+    if Booking.query.filter_by(user_id=user_id, class_id=class_id).first():
+        return {'success': False, 'message': 'Already booked'}, 200
+
+    def try_book():
+        try:
+            db.session.add(Booking(user_id=user_id, class_id=class_id)); log_activity(user_name, f"booked '{class_name}'.", user_id)
+            # A member who got a seat directly leaves the queue, or a later release would promote them again
+            db.session.execute(delete(Waitlist).where(Waitlist.user_id == user_id, Waitlist.class_id == class_id))
+            db.session.commit()
+            return {'success': True, 'message': 'Booked Successfully!'}
+        except ClassFullError:
+            db.session.rollback(); return None
+        except IntegrityError:
+            db.session.rollback(); return {'success': False, 'message': 'Already booked'}
+
+    def join_waitlist():
+        try:
+            db.session.add(Waitlist(user_id=user_id, class_id=class_id)); log_activity(user_name, f"joined waitlist for '{class_name}'.", user_id); db.session.commit()
+            return {'success': True, 'message': 'Class is full. You have been added to the waitlist.'}
+        except IntegrityError:
+            db.session.rollback(); return {'success': False, 'message': 'You are already on the waitlist for this class.'}
+
+    return (_with_lock_retries(try_book) or _with_lock_retries(join_waitlist)), 200
+
+def promote_waitlist(class_id, leaving_user_id=None):
+    # Hands the class's free seats to the head of its waitlist, inside the caller's transaction and
+    # after the released seats were flushed. Entries of members who meanwhile booked directly are
+    # dropped, and so is any entry of the member giving the seat up, who must not get it straight back.
+    stale = select(Booking.id).where(Booking.class_id == class_id, Booking.user_id == Waitlist.user_id).exists()
+    if leaving_user_id is not None: stale = or_(stale, Waitlist.user_id == leaving_user_id)
+    db.session.execute(delete(Waitlist).where(Waitlist.class_id == class_id, stale).execution_options(synchronize_session=False))
+    row = db.session.query(Class.name, Class.capacity - Class.booked_count).filter(Class.id == class_id).first()
+    if not row: return 0
+    class_name, free_seats = row
+    promoted = 0
+    while promoted < free_seats:
+        head = (Waitlist.query.filter_by(class_id=class_id).order_by(Waitlist.timestamp.asc(), Waitlist.id.asc())
+                .with_for_update(skip_locked=True).first())
+        if not head: break
+        db.session.add(Booking(user_id=head.user_id, class_id=class_id))
+        log_activity(head.member.name, f"auto-booked for '{class_name}' from waitlist.", head.user_id)
+        db.session.delete(head); db.session.flush()
+        promoted += 1
+    return promoted
+
+def cancel_booking(booking_id):
+    def txn(promote=True):
+        booking = Booking.query.get(booking_id)
+        if not booking: return False
+        class_id = booking.class_id; class_name = booking.class_info.name; user_id = booking.user_id
+        db.session.delete(booking); log_activity(booking.member.name, f"cancelled booking for '{class_name}'.", booking.user_id)
+        db.session.flush()  # release the seat before the head of the waitlist claims it
+        if promote: promote_waitlist(class_id, leaving_user_id=user_id)
+        else: db.session.execute(delete(Waitlist).where(Waitlist.user_id == user_id, Waitlist.class_id == class_id))
+        db.session.commit()
+        return True
+    try:
+        return _with_lock_retries(txn)
+    except (ClassFullError, IntegrityError):
+        # A concurrent booking raced the promotion; the cancellation still goes through and the
+        # queue is served by the next release
+        db.session.rollback()
+        return _with_lock_retries(lambda: txn(promote=False))
+
+# ----------------- ANALYTICS ENGINE -----------------
+# Payments, signups, bookings and attendance append a RollupDelta row in the same transaction as
+# the row that caused them. Upserting MonthlyRollup there would queue every booking in the gym on
+# the (current month, gym-wide) row lock, so a per-process folder thread moves committed deltas
+# into MonthlyRollup every ROLLUP_FOLD_INTERVAL seconds, and readers add the deltas not folded
+# yet, so dashboards read O(months) rows and stay exact. Rows written in bulk outside the ORM
+# (imports, generators) are reconciled with `flask backfill-rollups`.
+# Rollups are history: removing an account keeps its signup, bookings and attendance (as its
+# payments are kept), while cancellations and attendance corrections still count against them.
+_rollup_table = MonthlyRollup.__table__
+_delta_table = RollupDelta.__table__
+_removed_table = RemovedAccountRollup.__table__
+_ROLLUP_FIELDS = ('revenue_cents', 'signups', 'bookings', 'attendance')
+
+def month_key(when):
+    return when.strftime('%Y-%m')
+
+def month_expr(column):
+    # SQL expression rendering a DateTime column as 'YYYY-MM' on the bound backend
+    if db.engine.dialect.name == 'postgresql': return func.to_char(column, 'YYYY-MM')
+    return func.strftime('%Y-%m', column)
+
+def _upsert_rollup(connection, month, class_id, deltas):
+    dialect_insert = {'sqlite': sqlite_insert, 'postgresql': pg_insert}.get(connection.dialect.name)
+    if dialect_insert:
+        stmt = dialect_insert(_rollup_table).values(month=month, class_id=class_id, **deltas)
+        connection.execute(stmt.on_conflict_do_update(index_elements=['month', 'class_id'],
+                                                      set_={k: _rollup_table.c[k] + stmt.excluded[k] for k in deltas}))
+        return
+    updated = connection.execute(update(_rollup_table).where(_rollup_table.c.month == month, _rollup_table.c.class_id == class_id)
+                                 .values({k: _rollup_table.c[k] + v for k, v in deltas.items()})).rowcount
+    if not updated: connection.execute(_rollup_table.insert().values(month=month, class_id=class_id, **deltas))
+
+def bump_rollup(connection, target, when, class_id=0, **deltas):
+    if when is None: return
+    connection.execute(_delta_table.insert().values(month=month_key(when), class_id=class_id, **deltas))
+    session = object_session(target)
+    if session is not None: session.info['rollup_deltas'] = True
+
+def fold_rollup_deltas():
+    # Moves every committed delta into MonthlyRollup. DELETE ... RETURNING claims the rows, so two
+    # folders (or two worker processes) never apply the same delta twice.
+    columns = [_delta_table.c.month, _delta_table.c.class_id] + [_delta_table.c[k] for k in _ROLLUP_FIELDS]
+    totals = defaultdict(lambda: dict.fromkeys(_ROLLUP_FIELDS, 0))
+    for row in db.session.execute(delete(_delta_table).returning(*columns)):
+        for key in {(row.month, 0), (row.month, row.class_id)}:
+            for k in _ROLLUP_FIELDS: totals[key][k] += getattr(row, k)
+    connection = db.session.connection()
+    for (month, class_id), deltas in sorted(totals.items()):  # fixed order, so concurrent folders cannot deadlock
+        _upsert_rollup(connection, month, class_id, deltas)
+    return len(totals)
+
+class RollupFolder:
+    # One daemon thread per process, started by the first commit that appends deltas and stopped
+    # once an interval passes without new ones
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.cond = threading.Condition()
+        self.pending = False
+        self.thread = None
+        self.pid = None
+
+    def notify(self):
+        with self.cond:
+            self.pending = True
+            if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, name='rollup-folder', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.app.config['ROLLUP_FOLD_INTERVAL'])
+            with self.cond:
+                if not self.pending:
+                    self.thread = None; return
+                self.pending = False
+            self.fold()
+
+    def fold(self):
+        def txn():
+            folded = fold_rollup_deltas(); db.session.commit(); return folded
+        try:
+            with self.app.app_context():
+                return _with_lock_retries(txn)
+        except Exception:
+            self.app.logger.exception("Folding rollup deltas failed; they stay queued for the next run")
+
+rollup_folder = RollupFolder(app)
+
+@event.listens_for(Session, 'after_commit')
+def _schedule_rollup_fold(session):
+    if session.info.pop('rollup_deltas', False): rollup_folder.notify()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rollup_fold(session):
+    session.info.pop('rollup_deltas', None); session.info.pop('removed_user_ids', None)
+
+@event.listens_for(Session, 'before_flush')
+def _collect_removed_accounts(session, flush_context, instances):
+    removed = [obj.id for obj in session.deleted if isinstance(obj, User)]
+    if removed: session.info.setdefault('removed_user_ids', set()).update(removed)
+
+@event.listens_for(Session, 'after_commit')
+def _forget_removed_accounts(session):
+    session.info.pop('removed_user_ids', None)
+
+def _removed_with_account(target, user_id):
+    session = object_session(target)
+    return session is not None and user_id in session.info.get('removed_user_ids', ())
+
+def retain_rollup(connection, when, class_id=0, **counts):
+    if when is not None: connection.execute(_removed_table.insert().values(month=month_key(when), class_id=class_id, **counts))
+
+@event.listens_for(Payment, 'after_insert')
+def _rollup_payment(mapper, connection, target):
+    bump_rollup(connection, target, target.paid_at, revenue_cents=target.amount_cents)
+
+@event.listens_for(Payment, 'after_delete')
+def _rollup_payment_removed(mapper, connection, target):
+    bump_rollup(connection, target, target.paid_at, revenue_cents=-target.amount_cents)
+
+@event.listens_for(User, 'after_insert')
+def _rollup_signup(mapper, connection, target):
+    bump_rollup(connection, target, target.created_at, signups=1)
+
+@event.listens_for(User, 'after_delete')
+def _rollup_signup_removed(mapper, connection, target):
+    retain_rollup(connection, target.created_at, signups=1)
+
+@event.listens_for(Booking, 'after_insert')
+def _rollup_booking(mapper, connection, target):
+    bump_rollup(connection, target, target.booking_date, target.class_id, bookings=1, attendance=int(target.status == 'ATTENDED'))
+
+@event.listens_for(Booking, 'after_delete')
+def _rollup_booking_removed(mapper, connection, target):
+    if _removed_with_account(target, target.user_id):
+        retain_rollup(connection, target.booking_date, target.class_id, bookings=1, attendance=int(target.status == 'ATTENDED')); return
+    bump_rollup(connection, target, target.booking_date, target.class_id, bookings=-1, attendance=-int(target.status == 'ATTENDED'))
+
+@event.listens_for(Booking, 'after_update')
+def _rollup_attendance(mapper, connection, target):
+    history = inspect(target).attrs.status.history
+    if not history.has_changes(): return
+    was_attended = 'ATTENDED' in (history.deleted or ()); is_attended = target.status == 'ATTENDED'
+    if was_attended != is_attended: bump_rollup(connection, target, target.booking_date, target.class_id, attendance=1 if is_attended else -1)
+
+def backfill_rollups():
+    # Rebuilds MonthlyRollup from the transactional tables with one grouped query per source
+    rows = defaultdict(lambda: dict.fromkeys(_ROLLUP_FIELDS, 0))
+    booking_month = month_expr(Booking.booking_date)
+    attended = func.sum(db.case((Booking.status == 'ATTENDED', 1), else_=0))
+    for month, class_id, bookings, attendance in db.session.query(booking_month, Booking.class_id, func.count(Booking.id), attended).group_by(booking_month, Booking.class_id):
+        for key in ((month, 0), (month, class_id)):
+            rows[key]['bookings'] += bookings; rows[key]['attendance'] += attendance or 0
+    signup_month = month_expr(User.created_at)
+    for month, signups in db.session.query(signup_month, func.count(User.id)).filter(User.created_at.isnot(None)).group_by(signup_month):
+        rows[(month, 0)]['signups'] = signups
+    removed_month, removed_class = _removed_table.c.month, _removed_table.c.class_id
+    for month, class_id, signups, bookings, attendance in db.session.execute(
+            select(removed_month, removed_class, func.sum(_removed_table.c.signups), func.sum(_removed_table.c.bookings),
+                   func.sum(_removed_table.c.attendance)).group_by(removed_month, removed_class)):
+        for key in {(month, 0), (month, class_id)}:
+            rows[key]['signups'] += signups
+            rows[key]['bookings'] += bookings; rows[key]['attendance'] += attendance
+    payment_month = month_expr(Payment.paid_at)
+    for month, revenue in db.session.query(payment_month, func.sum(Payment.amount_cents)).group_by(payment_month):
+        rows[(month, 0)]['revenue_cents'] = revenue or 0
+    db.session.execute(delete(_rollup_table)); db.session.execute(delete(_delta_table))  # the sources already include pending deltas
+    if rows: db.session.execute(_rollup_table.insert(), [dict(month=m, class_id=c, **v) for (m, c), v in rows.items()])
+    db.session.commit()
+    return len(rows)
+
+def record_payment(user_id, amount_cents, description, plan=None, months=1):
+    membership = None
+    if plan:
+        now = datetime.datetime.utcnow()
+        current = Membership.query.filter_by(user_id=user_id).order_by(desc(Membership.expires_at)).first()
+        starts = max(now, current.expires_at) if current else now
+        membership = Membership(user_id=user_id, plan=plan, started_at=starts, expires_at=starts + datetime.timedelta(days=30 * months))
+        db.session.add(membership)
+    payment = Payment(user_id=user_id, membership=membership, amount_cents=amount_cents, description=description)
+    db.session.add(payment)
+    return payment
+
+def rollup_months(class_id=0):
+    # Folded rollup rows plus the deltas still waiting for the folder, summed per month
+    fields = lambda table: [table.c[k] for k in _ROLLUP_FIELDS]
+    folded = select(_rollup_table.c.month, *fields(_rollup_table)).where(_rollup_table.c.class_id == class_id)
+    pending = select(_delta_table.c.month, *fields(_delta_table))
+    if class_id: pending = pending.where(_delta_table.c.class_id == class_id)
+    merged = union_all(folded, pending).subquery('merged')
+    return db.session.execute(select(merged.c.month, *[func.sum(merged.c[k]).label(k) for k in _ROLLUP_FIELDS])
+                              .group_by(merged.c.month).order_by(merged.c.month)).all()
+
+def revenue_overview(months=6):
+    rollups = rollup_months()
+    revenue_data = {datetime.datetime.strptime(r.month, '%Y-%m').strftime('%b %Y'): r.revenue_cents / 100 for r in rollups[-months:]}
+    return sum(r.revenue_cents for r in rollups) / 100, revenue_data
+
+# ----------------- BULK IMPORT / EXPORT -----------------
+# Streaming CSV/JSONL readers and writers for `flask import-data` / `flask export-data`.
+# Rows reference users by email so files move between databases; classes are referenced by id.
+# Imports insert in batches with plain INSERTs (conflicting rows are skipped and counted as
+# duplicates), so seat capacity, seat counters and monthly rollups are reconciled once at the end
+# instead of per row.
+DATA_FIELDS = {
+    'users': ('name', 'email', 'role', 'goal', 'created_at', 'password_hash', 'trainer_email'),
+    'weight-logs': ('user_email', 'date', 'weight_lb'),
+    'bookings': ('user_email', 'class_id', 'booking_date', 'status'),
+    'workout-plans': ('member_email', 'trainer_name', 'title', 'description', 'assigned_date'),
+}
+
+def _hash_password(password):
+    return bcrypt.generate_password_hash(password).decode('utf-8')
+
+def _parse_datetime(value):
+    return datetime.datetime.fromisoformat(value) if value else None
+
+def data_format(path, fmt=None):
+    return fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+
+def read_records(path, fmt):
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if not line.strip(): continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None  # still counted as a row, so resuming skips the same lines
+
+def write_records(path, fmt, fields, records):
+    written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields) if fmt == 'csv' else None
+        if writer: writer.writeheader()
+        for record in records:
+            record = {k: (v.isoformat() if isinstance(v, (datetime.date, datetime.datetime)) else v) for k, v in record.items()}
+            if writer: writer.writerow(record)
+            else: f.write(json.dumps(record) + '\n')
+            written += 1
+    return written
+
+def _keyset_chunks(query, id_column, chunk_size):
+    last_id = 0
+    while True:
+        rows = query.filter(id_column > last_id).order_by(id_column).limit(chunk_size).all()
+        if not rows: return
+        yield from rows
+        last_id = rows[-1].id
+
+def export_records(entity, chunk_size=1000):
+    if entity == 'users':
+        trainer = db.aliased(User)
+        trainer_email = (select(trainer.email).join(trainer_client_association, trainer_client_association.c.trainer_id == trainer.id)
+                         .where(trainer_client_association.c.client_id == User.id).limit(1).scalar_subquery())
+        query = db.session.query(User.id, User.name, User.email, User.role, User.goal, User.created_at,
+                                 User.password.label('password_hash'), trainer_email.label('trainer_email'))
+        id_column = User.id
+    elif entity == 'weight-logs':
+        query = db.session.query(WeightLog.id, User.email.label('user_email'), WeightLog.date, WeightLog.weight_lb).join(User, User.id == WeightLog.user_id)
+        id_column = WeightLog.id
+    elif entity == 'bookings':
+        query = db.session.query(Booking.id, User.email.label('user_email'), Booking.class_id, Booking.booking_date, Booking.status).join(User, User.id == Booking.user_id)
+        id_column = Booking.id
+    else:
+        query = db.session.query(WorkoutPlan.id, User.email.label('member_email'), WorkoutPlan.trainer_name, WorkoutPlan.title,
+                                 WorkoutPlan.description, WorkoutPlan.assigned_date).join(User, User.id == WorkoutPlan.member_id)
+        id_column = WorkoutPlan.id
+    for row in _keyset_chunks(query, id_column, chunk_size):
+        yield {field: getattr(row, field) for field in DATA_FIELDS[entity]}
+
+def _insert_skipping_conflicts(table, rows):
+    # Returns the number of rows inserted; the rest already existed
+    if not rows: return 0
+    dialect_insert = {'sqlite': sqlite_insert, 'postgresql': pg_insert}.get(db.engine.dialect.name)
+    if not dialect_insert:
+        db.session.execute(table.insert(), rows); return len(rows)
+    return len(db.session.execute(dialect_insert(table).on_conflict_do_nothing().returning(list(table.c)[0]), rows).all())
+
+def _ids_by_email(emails):
+    emails = {e for e in emails if e}
+    return dict(db.session.query(User.email, User.id).filter(User.email.in_(emails)).all()) if emails else {}
+
+def _parse_each(records, parse):
+    # Returns (record, row) pairs; records that are malformed (bad numbers or dates, undecodable
+    # lines) or rejected by `parse` are left out and counted as skipped by the caller
+    parsed = []
+    for record in records:
+        try:
+            row = parse(record) if isinstance(record, dict) else None
+        except (TypeError, ValueError, KeyError):
+            row = None
+        if row is not None: parsed.append((record, row))
+    return parsed
+
+def _user_row(r, now):
+    password = r.get('password_hash') or r.get('password')
+    if not (r.get('name') and r.get('email') and r.get('role') in ('admin', 'trainer', 'member') and isinstance(password, str)): return None
+    return {'name': str(r['name']), 'email': str(r['email']), 'role': r['role'], 'goal': str(r['goal']) if r.get('goal') else None,
+            'created_at': _parse_datetime(r.get('created_at')) or now, 'password': r.get('password_hash') or None}
+
+def import_batch(entity, records, pool=None):
+    # Inserts one batch; returns (invalid, duplicates): records that were malformed or rejected, and
+    # valid rows skipped because they already exist (same email, or same member and class)
+    now = datetime.datetime.utcnow()
+    if entity == 'users':
+        parsed = _parse_each(records, lambda r: _user_row(r, now))
+        plain = [r['password'] for r, row in parsed if not row['password']]
+        hashed = iter((pool.map(_hash_password, plain, chunksize=max(1, len(plain) // 32)) if pool else map(_hash_password, plain)))
+        rows = [row if row['password'] else dict(row, password=next(hashed)) for _, row in parsed]
+        return len(records) - len(rows), len(rows) - _insert_skipping_conflicts(User.__table__, rows)
+    email_key = 'member_email' if entity == 'workout-plans' else 'user_email'
+    ids = _ids_by_email(r[email_key] for r in records if isinstance(r, dict) and isinstance(r.get(email_key), str))
+    if entity == 'weight-logs':
+        def parse(r):
+            if r.get(email_key) not in ids or not (r.get('date') and r.get('weight_lb')): return None
+            return {'user_id': ids[r['user_email']], 'date': datetime.date.fromisoformat(r['date'][:10]), 'weight_lb': float(r['weight_lb'])}
+        table = WeightLog.__table__
+    elif entity == 'bookings':
+        class_ids = {row[0] for row in db.session.query(Class.id)}
+        def parse(r):
+            if r.get(email_key) not in ids or not r.get('class_id') or int(r['class_id']) not in class_ids: return None
+            return {'user_id': ids[r['user_email']], 'class_id': int(r['class_id']), 'booking_date': _parse_datetime(r.get('booking_date')) or now,
+                    'status': str(r.get('status') or 'BOOKED')}
+        table = Booking.__table__
+    else:
+        def parse(r):
+            if r.get(email_key) not in ids or not r.get('title'): return None
+            return {'member_id': ids[r['member_email']], 'trainer_name': str(r.get('trainer_name') or ''), 'title': str(r['title']),
+                    'description': str(r.get('description') or ''), 'assigned_date': _parse_datetime(r.get('assigned_date')) or now}
+        table = WorkoutPlan.__table__
+    rows = [row for _, row in _parse_each(records, parse)]
+    return len(records) - len(rows), len(rows) - _insert_skipping_conflicts(table, rows)
+
+def waitlist_overbooked_classes(chunk_size=1000):
+    # Bulk-inserted bookings skip the seat claim, so a class can end up over capacity. Seats go to
+    # bookings in the order they were recorded (existing bookings first, then the file's order);
+    # the rest move to the class's waitlist. Returns (bookings moved, classes affected).
+    over_capacity = (select(Booking.class_id).join(_class_table, _class_table.c.id == Booking.class_id)
+                     .group_by(Booking.class_id, _class_table.c.capacity).having(func.count(Booking.id) > _class_table.c.capacity))
+    seat = func.row_number().over(partition_by=Booking.class_id, order_by=Booking.id).label('seat')
+    ranked = select(Booking.id, Booking.user_id, Booking.class_id, Booking.booking_date, seat).where(Booking.class_id.in_(over_capacity)).subquery()
+    overflow = db.session.execute(select(ranked.c.id, ranked.c.user_id, ranked.c.class_id, ranked.c.booking_date)
+                                  .join(_class_table, _class_table.c.id == ranked.c.class_id)
+                                  .where(ranked.c.seat > _class_table.c.capacity).order_by(ranked.c.id)).all()
+    for i in range(0, len(overflow), chunk_size):
+        chunk = overflow[i:i + chunk_size]
+        _insert_skipping_conflicts(Waitlist.__table__, [{'user_id': r.user_id, 'class_id': r.class_id,
+                                                         'timestamp': r.booking_date or datetime.datetime.utcnow()} for r in chunk])
+        db.session.execute(delete(Booking.__table__).where(Booking.__table__.c.id.in_([r.id for r in chunk])))
+    return len(overflow), len({r.class_id for r in overflow})
+
+def import_trainer_links(records, batch_size=1000):
+    # Runs once every user row of the file is in, so a client listed before their trainer is still linked
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch: return
+        links = [(r['trainer_email'], r['email']) for r in batch
+                 if isinstance(r, dict) and isinstance(r.get('trainer_email'), str) and isinstance(r.get('email'), str) and r['trainer_email']]
+        ids = _ids_by_email(itertools.chain.from_iterable(links))
+        _insert_skipping_conflicts(trainer_client_association, [{'trainer_id': ids[t], 'client_id': ids[c]} for t, c in links if t in ids and c in ids])
+
+# ----------------- MEASUREMENT SERIES -----------------
+# Weight/BMI history is served as date-ranged series. Measurement rows and legacy WeightLog rows
+# are merged in SQL as (user_id, epoch, weight_kg, bmi) points; bucketed series are aggregated
+# with GROUP BY, and raw series are reduced with LTTB so multi-year histories stay small.
+# Bucketed series honour max_points too: a range holding more buckets than that is served with
+# the next coarser bucket, and past monthly buckets runs of adjacent months are merged.
+LB_TO_KG = 0.45359237
+SERIES_BUCKETS = {'day': 86400, 'week': 604800, 'month': 2629746}  # month: the average length, to pick a bucket
+SERIES_MAX_POINTS = 1000
+WEIGHT_HISTORY_ROWS = 50  # rows in the profile tables; longer histories come from the series API
+
+def epoch_expr(column):
+    if db.engine.dialect.name == 'postgresql': return cast(func.extract('epoch', column), db.BigInteger)
+    return cast(func.strftime('%s', column), db.Integer)
+
+def epoch_month_expr(epoch):
+    if db.engine.dialect.name == 'postgresql': return func.to_char(func.to_timestamp(epoch), 'YYYY-MM')
+    return func.strftime('%Y-%m', epoch, 'unixepoch')
+
+def bmi_status(bmi):
+    if bmi < 18.5: return "Underweight"
+    if bmi < 24.9: return "Normal weight"
+    if bmi < 29.9: return "Overweight"
+    return "Obese"
+
+def measurement_points(user_ids, start=None, end=None):
+    measured = select(Measurement.user_id.label('user_id'), epoch_expr(Measurement.taken_at).label('epoch'),
+                      Measurement.weight_kg.label('weight_kg'), Measurement.bmi.label('bmi')).where(Measurement.user_id.in_(user_ids))
+    logged = select(WeightLog.user_id, epoch_expr(WeightLog.date), WeightLog.weight_lb * LB_TO_KG,
+                    literal(None, db.Float)).where(WeightLog.user_id.in_(user_ids))
+    if start:
+        measured = measured.where(Measurement.taken_at >= datetime.datetime.combine(start, datetime.time.min)); logged = logged.where(WeightLog.date >= start)
+    if end:
+        measured = measured.where(Measurement.taken_at < datetime.datetime.combine(end, datetime.time.min) + datetime.timedelta(days=1)); logged = logged.where(WeightLog.date <= end)
+    return union_all(measured, logged).subquery('points')
+
+def epoch_to_iso(epoch):
+    return (datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=int(epoch))).isoformat()
+
+def parse_day(value):
+    return datetime.date.fromisoformat(value) if value else None
+
+def lttb(points, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point and, per bucket, the point
+    # forming the largest triangle with the previously kept point and the next bucket's average
+    if threshold >= len(points) or threshold < 3: return points
+    every = (len(points) - 2) / (threshold - 2)
+    sampled, kept = [points[0]], 0
+    for i in range(threshold - 2):
+        avg_start, avg_end = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, len(points))
+        avg_x = sum(p[0] for p in points[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(p[1] for p in points[avg_start:avg_end]) / (avg_end - avg_start)
+        ax, ay = points[kept]
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area: best, best_area = j, area
+        sampled.append(points[best]); kept = best
+    sampled.append(points[-1])
+    return sampled
+
+def merge_buckets(rows, max_points):
+    # Folds runs of adjacent buckets into one (count-weighted average, overall min/max) until at most max_points remain
+    size = -(-len(rows) // max_points)
+    merged = []
+    for i in range(0, len(rows), size):
+        run = rows[i:i + size]
+        count = sum(r['count'] for r in run)
+        merged.append({'epoch': run[0]['epoch'], 'value': sum(r['value'] * r['count'] for r in run) / count,
+                       'min': min(r['min'] for r in run), 'max': max(r['max'] for r in run), 'count': count})
+    return merged
+
+def measurement_series(user_id, metric='weight', start=None, end=None, bucket=None, max_points=200):
+    # Returns (points, bucket); the bucket may be coarser than the one asked for (see above)
+    points = measurement_points([user_id], start, end)
+    value = points.c.weight_kg if metric == 'weight' else points.c.bmi
+    if bucket:
+        first, last = db.session.execute(select(func.min(points.c.epoch), func.max(points.c.epoch)).where(value.isnot(None))).one()
+        coarser = list(SERIES_BUCKETS)[list(SERIES_BUCKETS).index(bucket):]
+        bucket = next((b for b in coarser if first is None or (last - first) // SERIES_BUCKETS[b] < max_points), coarser[-1])
+        key = epoch_month_expr(points.c.epoch) if bucket == 'month' else points.c.epoch // SERIES_BUCKETS[bucket]
+        rows = db.session.execute(select(func.min(points.c.epoch), func.avg(value), func.min(value), func.max(value), func.count(value))
+                                  .where(value.isnot(None)).group_by(key).order_by(func.min(points.c.epoch))).all()
+        series = [{'epoch': r[0], 'value': r[1], 'min': r[2], 'max': r[3], 'count': r[4]} for r in rows]
+        return (merge_buckets(series, max_points) if len(series) > max_points else series), bucket
+    rows = db.session.execute(select(points.c.epoch, value).where(value.isnot(None)).order_by(points.c.epoch)).all()
+    return [{'epoch': x, 'value': y} for x, y in lttb([tuple(r) for r in rows], max_points)], None
+
+def cohort_progress(trainer_id, start=None):
+    # One statement: window functions pick each client's first/latest point, left-joined onto the client list
+    points = measurement_points(_client_ids_of(trainer_id), start)
+    # BMI ranks are taken within the rows that carry a BMI (legacy weight logs do not)
+    bmi_partition = [points.c.user_id, points.c.bmi.is_(None)]
+    ranked = select(points.c.user_id, points.c.epoch, points.c.weight_kg, points.c.bmi,
+                    func.row_number().over(partition_by=points.c.user_id, order_by=points.c.epoch).label('first_rank'),
+                    func.row_number().over(partition_by=points.c.user_id, order_by=desc(points.c.epoch)).label('last_rank'),
+                    func.row_number().over(partition_by=bmi_partition, order_by=points.c.epoch).label('first_bmi_rank'),
+                    func.row_number().over(partition_by=bmi_partition, order_by=desc(points.c.epoch)).label('last_bmi_rank')).subquery('ranked')
+    first, last = ranked.c.first_rank == 1, ranked.c.last_rank == 1
+    first_bmi, last_bmi = ranked.c.first_bmi_rank == 1, ranked.c.last_bmi_rank == 1
+    per_client = select(
+        ranked.c.user_id,
+        func.max(db.case((first, ranked.c.weight_kg))).label('start_weight_kg'), func.max(db.case((last, ranked.c.weight_kg))).label('latest_weight_kg'),
+        func.max(db.case((first_bmi, ranked.c.bmi))).label('start_bmi'), func.max(db.case((last_bmi, ranked.c.bmi))).label('latest_bmi'),
+        func.min(ranked.c.epoch).label('first_epoch'), func.max(ranked.c.epoch).label('last_epoch'), func.count().label('measurements'),
+    ).group_by(ranked.c.user_id).subquery('per_client')
+    rows = db.session.execute(select(User.id, User.name, User.goal, per_client)
+                              .outerjoin(per_client, per_client.c.user_id == User.id)
+                              .where(User.id.in_(_client_ids_of(trainer_id))).order_by(User.name)).mappings().all()
+    return rows
+
+# ----------------- SYNTHETIC DATA -----------------
+# Builds a gym of arbitrary size for load tests and benchmarks. Popularity is skewed the way
+# real gyms are: class demand follows a Zipf curve, member activity a Pareto (80/20) curve,
+# some trainers carry most of the clients, and signups and bookings grow towards the present.
+# Rows are bulk inserted outside the ORM; seat counters and rollups are rebuilt at the end.
+SYNTHETIC_FIRST_NAMES = ('Aarav', 'Ana', 'Ben', 'Chen', 'Diego', 'Emma', 'Fatima', 'Grace', 'Hiro', 'Isla', 'Jonas', 'Kofi',
+                         'Lena', 'Maya', 'Noah', 'Olga', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tariq', 'Uma', 'Victor', 'Yara')
+SYNTHETIC_LAST_NAMES = ('Silva', 'Kim', 'Novak', 'Okafor', 'Patel', 'Rossi', 'Schmidt', 'Tanaka', 'Walsh', 'Yilmaz', 'Lopez', 'Singh')
+SYNTHETIC_CLASSES = ('Yoga', 'Spinning', 'Kickboxing', 'Pilates', 'Zumba', 'HIIT', 'CrossFit', 'Boxing', 'Barre', 'Aqua Fit',
+                     'Bootcamp', 'Mobility', 'Power Lifting', 'Step', 'Tai Chi', 'Core Blast')
+SYNTHETIC_GOALS = ('Weight Loss', 'General Fitness', 'Bodybuilding', 'Endurance', 'Flexibility', None)
+SYNTHETIC_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+SYNTHETIC_CHUNK = 10000
+
+def _cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+def _recent_datetime(rng, now, days):
+    # Density grows linearly towards `now`, like a gym that keeps gaining members
+    return now - datetime.timedelta(days=days * (1 - rng.random() ** 0.5))
+
+def _bulk_insert(table, rows):
+    for start in range(0, len(rows), SYNTHETIC_CHUNK):
+        db.session.execute(table.insert(), rows[start:start + SYNTHETIC_CHUNK])
+
+def generate_gym_data(members=2000, trainers=20, classes=40, bookings=30000, waitlist=2000, weight_logs=40000,
+                      activity=50000, plans=1000, months=12, seed=42, password='password'):
+    # Drops all tables and fills them with a synthetic gym; returns the row counts written
+    rng = random.Random(seed)
+    now = datetime.datetime.utcnow()
+    days = months * 30
+    db.drop_all(); db.create_all()
+    password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+
+    users = [{'name': 'Admin User', 'email': 'admin@gym.test', 'password': password_hash, 'role': 'admin', 'goal': None,
+              'created_at': now - datetime.timedelta(days=days)}]
+    for role, count in (('trainer', trainers), ('member', members)):
+        for i in range(count):
+            first, last = rng.choice(SYNTHETIC_FIRST_NAMES), rng.choice(SYNTHETIC_LAST_NAMES)
+            users.append({'name': f'{first} {last}', 'email': f'{role}{i}@gym.test', 'password': password_hash, 'role': role,
+                          'goal': rng.choice(SYNTHETIC_GOALS) if role == 'member' else None,
+                          'created_at': _recent_datetime(rng, now, days)})
+    _bulk_insert(User.__table__, users)
+    ids = dict(db.session.query(User.email, User.id))
+    trainer_ids = [ids[f'trainer{i}@gym.test'] for i in range(trainers)]
+    member_ids = [ids[f'member{i}@gym.test'] for i in range(members)]
+    member_since = {ids[u['email']]: u['created_at'] for u in users}
+    names = {ids[u['email']]: u['name'] for u in users}
+
+    # A few trainers carry most of the clients; about one member in seven trains alone
+    client_of = {}
+    if trainer_ids:
+        trainer_weights = _cumulative(1 / rank ** 1.1 for rank in range(1, trainers + 1))
+        client_of = {m: t for m, t in zip(member_ids, rng.choices(trainer_ids, cum_weights=trainer_weights, k=members))
+                     if rng.random() < 0.85}
+        db.session.execute(trainer_client_association.insert(), [{'trainer_id': t, 'client_id': m} for m, t in client_of.items()])
+
+    class_rows = [{'name': SYNTHETIC_CLASSES[i % len(SYNTHETIC_CLASSES)] + (f' {i // len(SYNTHETIC_CLASSES) + 1}' if i >= len(SYNTHETIC_CLASSES) else ''),
+                   'description': 'Synthetic class for load testing.', 'day': SYNTHETIC_DAYS[i % 7],
+                   'time': f'{6 + i % 14}:00', 'duration': rng.choice(('30 min', '45 min', '60 min')), 'image_url': '',
+                   'capacity': 0, 'booked_count': 0} for i in range(classes)]
+    _bulk_insert(Class.__table__, class_rows)
+    class_ids = [c.id for c in Class.query.order_by(Class.id)]
+    class_names = dict(db.session.query(Class.id, Class.name))
+
+    # Zipf class demand x Pareto member activity, one booking per (member, class) pair
+    member_weights = _cumulative(rng.paretovariate(1.16) for _ in member_ids)
+    class_weights = _cumulative(1 / rank ** 1.1 for rank in range(1, classes + 1))
+    bookings = min(bookings, int(members * classes * 0.5))
+    pairs, draws = set(), 0
+    while len(pairs) < bookings and draws < bookings * 20 and member_ids and class_ids:
+        batch = bookings - len(pairs)
+        pairs.update(zip(rng.choices(member_ids, cum_weights=member_weights, k=batch),
+                         rng.choices(class_ids, cum_weights=class_weights, k=batch)))
+        draws += batch
+    booking_rows, per_class = [], defaultdict(int)
+    for member_id, class_id in sorted(pairs):
+        if rng.random() < 0.05:
+            when, status = now + datetime.timedelta(days=rng.random() * 7), 'BOOKED'
+        else:
+            when = max(_recent_datetime(rng, now, days), member_since[member_id])
+            status = rng.choices(('ATTENDED', 'MISSED', 'BOOKED'), weights=(75, 15, 10))[0]
+        booking_rows.append({'user_id': member_id, 'class_id': class_id, 'booking_date': when, 'status': status})
+        per_class[class_id] += 1
+    _bulk_insert(Booking.__table__, booking_rows)
+
+    # The most popular fifth of the classes are full (and carry the waitlists); the rest have free seats
+    full_classes = class_ids[:max(1, classes // 5)] if class_ids else []
+    for class_id in class_ids:
+        booked = per_class[class_id]
+        capacity = booked if class_id in full_classes and booked else booked + rng.randint(5, 30)
+        db.session.execute(update(Class.__table__).where(Class.__table__.c.id == class_id).values(capacity=capacity, booked_count=booked))
+    waitlist_rows, waiting, draws = [], set(), 0
+    full_weights = _cumulative(1 / rank ** 1.1 for rank in range(1, len(full_classes) + 1))
+    while len(waitlist_rows) < waitlist and draws < waitlist * 20 and full_classes and member_ids:
+        draws += 1
+        # Anyone may be queueing for a full class, not just the regulars who already hold most seats
+        pair = (rng.choice(member_ids), rng.choices(full_classes, cum_weights=full_weights)[0])
+        if pair in pairs or pair in waiting: continue
+        waiting.add(pair)
+        waitlist_rows.append({'user_id': pair[0], 'class_id': pair[1], 'timestamp': now - datetime.timedelta(hours=rng.random() * 72)})
+    _bulk_insert(Waitlist.__table__, waitlist_rows)
+
+    # Keen members log their weight far more often; each series drifts from its own starting weight
+    weight_rows = []
+    for member_id, count in Counter(rng.choices(member_ids, cum_weights=member_weights, k=weight_logs) if member_ids else []).items():
+        start_weight, drift = rng.uniform(120, 260), rng.uniform(-0.08, 0.03)
+        tenure = max((now - member_since[member_id]).days, 1)
+        for offset in sorted(rng.randrange(tenure) for _ in range(count)):
+            weight_rows.append({'user_id': member_id, 'date': (member_since[member_id] + datetime.timedelta(days=offset)).date(),
+                                'weight_lb': round(start_weight + drift * offset + rng.gauss(0, 1.5), 1)})
+    _bulk_insert(WeightLog.__table__, weight_rows)
+
+    clients = list(client_of)
+    plan_rows = [{'member_id': member_id, 'trainer_name': names[client_of[member_id]], 'title': f'{rng.choice(SYNTHETIC_CLASSES)} Plan',
+                  'description': 'Synthetic workout plan.', 'assigned_date': max(_recent_datetime(rng, now, days), member_since[member_id])}
+                 for member_id in (rng.choice(clients) for _ in range(plans if clients else 0))]
+    _bulk_insert(WorkoutPlan.__table__, plan_rows)
+
+    # Monthly membership fees: most members pay every month since they joined
+    payment_rows = []
+    for member_id in member_ids:
+        paid_at = member_since[member_id]
+        while paid_at <= now:
+            if rng.random() < 0.9:
+                payment_rows.append({'user_id': member_id, 'amount_cents': rng.choice((2900, 4900, 4900, 7900)),
+                                     'description': 'Monthly membership', 'paid_at': paid_at})
+            paid_at += datetime.timedelta(days=30)
+    _bulk_insert(Payment.__table__, payment_rows)
+
+    # Activity feed entries, inserted oldest first so ids follow time as they do in production
+    actions = ("booked '{}'.", "cancelled booking for '{}'.", "joined waitlist for '{}'.", "auto-booked for '{}' from waitlist.")
+    activity_rows = []
+    for actor in (rng.choices(member_ids, cum_weights=member_weights, k=activity) if member_ids and class_ids else []):
+        class_name = class_names[rng.choices(class_ids, cum_weights=class_weights)[0]]
+        message = rng.choices(actions, weights=(70, 15, 10, 5))[0].format(class_name)
+        activity_rows.append({'user_id': actor, 'user_name': names[actor], 'message': message, 'timestamp': _recent_datetime(rng, now, days)})
+    activity_rows.sort(key=lambda row: row['timestamp'])
+    _bulk_insert(ActivityLog.__table__, activity_rows)
+    db.session.commit()
+    backfill_rollups()
+    # Ids were reused, so anything this process cached about the old tables is wrong
+    identity_cache.invalidate(list(identity_cache.entries)); class_catalog.invalidate()
+    invalidate_trainer_dashboards()
+    return {'users': len(users), 'trainers': trainers, 'members': members, 'trainer_clients': len(client_of), 'classes': classes,
+            'bookings': len(booking_rows), 'waitlist': len(waitlist_rows), 'weight_logs': len(weight_rows),
+            'workout_plans': len(plan_rows), 'payments': len(payment_rows), 'activity_logs': len(activity_rows)}
+
+# ----------------- REQUEST INSTRUMENTATION -----------------
+# Opt-in (PROFILING_ENABLED). Engine events time every statement run during a request, and
+# request hooks fold wall time, query count and SQL time into per-endpoint histograms that
+# /admin/metrics exposes in Prometheus text format. A sampled share of requests also runs
+# under cProfile and is dumped to PROFILING_DUMP_DIR. Metrics are kept per worker process.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1; return
+        self.counts[-1] += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {cumulative}'
+
+class RequestMetrics:
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.responses = defaultdict(int)
+
+    def observe(self, endpoint, status, wall, queries, sql_time, statements):
+        keep = self.app.config['PROFILING_SLOW_STATEMENTS']
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {'wall': Histogram(DURATION_BUCKETS), 'sql': Histogram(DURATION_BUCKETS),
+                                                    'queries': Histogram(QUERY_COUNT_BUCKETS), 'slowest': []}
+            stats['wall'].observe(wall); stats['sql'].observe(sql_time); stats['queries'].observe(queries)
+            self.responses[(endpoint, status)] += 1
+            for duration, statement in statements:
+                # Min-heap of the slowest statements seen, one entry per distinct SQL string
+                slowest = stats['slowest']
+                existing = next((i for i, item in enumerate(slowest) if item[1] == statement), None)
+                if existing is not None:
+                    if duration > slowest[existing][0]: slowest[existing] = (duration, statement); heapq.heapify(slowest)
+                elif len(slowest) < keep: heapq.heappush(slowest, (duration, statement))
+                elif duration > slowest[0][0]: heapq.heapreplace(slowest, (duration, statement))
+
+    def slow_statements(self):
+        with self.lock:
+            return {endpoint: [{'seconds': round(d, 6), 'statement': sql} for d, sql in sorted(stats['slowest'], reverse=True)]
+                    for endpoint, stats in self.endpoints.items()}
+
+    def render_prometheus(self):
+        families = (('gym_request_duration_seconds', 'wall', 'Request wall time by endpoint.'),
+                    ('gym_request_sql_seconds', 'sql', 'Time spent in SQL statements per request.'),
+                    ('gym_request_queries', 'queries', 'SQL statements executed per request.'))
+        lines = []
+        with self.lock:
+            for name, key, help_text in families:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for endpoint, stats in sorted(self.endpoints.items()):
+                    lines.extend(stats[key].samples(name, f'endpoint="{endpoint}"'))
+            lines += ['# HELP gym_requests_total Responses by endpoint and status.', '# TYPE gym_requests_total counter']
+            lines += [f'gym_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}'
+                      for (endpoint, status), count in sorted(self.responses.items())]
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear(); self.responses.clear()
+
+request_metrics = RequestMetrics(app)
+# One sampled profile at a time per process: from Python 3.12 a second cProfile raises ValueError
+# while one is active, and an active profile sees every thread, so overlapping dumps would mix requests
+_profiler_lock = threading.Lock()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if app.config['PROFILING_ENABLED'] and has_request_context() and 'request_profile' in g:
+        conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('statement_started')
+    if not started or not has_request_context() or 'request_profile' not in g: return
+    elapsed = time.perf_counter() - started.pop()
+    profile = g.request_profile
+    profile['queries'] += 1; profile['sql_time'] += elapsed
+    profile['statements'].append((elapsed, ' '.join(statement.split())[:500]))
+
+@app.before_request
+def _start_request_profile():
+    if not app.config['PROFILING_ENABLED']: return
+    g.request_profile = {'started': time.perf_counter(), 'queries': 0, 'sql_time': 0.0, 'statements': [], 'profiler': None}
+    if random.random() < app.config['PROFILING_SAMPLE_RATE'] and _profiler_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiling tool (a debugger, coverage) holds the hook; skip this sample
+            _profiler_lock.release(); return
+        g.request_profile['profiler'] = profiler
+
+def _finish_request_profile(status):
+    profile = g.pop('request_profile')
+    wall = time.perf_counter() - profile['started']
+    endpoint = request.endpoint or 'unmatched'
+    if profile['profiler']:
+        try:
+            profile['profiler'].disable()
+            os.makedirs(app.config['PROFILING_DUMP_DIR'], exist_ok=True)
+            profile['profiler'].dump_stats(os.path.join(app.config['PROFILING_DUMP_DIR'],
+                                                        f"{endpoint}-{int(time.time() * 1000)}-{os.getpid()}.prof"))
+        except OSError:
+            app.logger.exception("Could not write the request profile")  # a sample never fails the request
+        finally:
+            _profiler_lock.release()
+    request_metrics.observe(endpoint, status, wall, profile['queries'], profile['sql_time'], profile['statements'])
+    return wall, profile
+
+@app.after_request
+def _record_request_profile(response):
+    if 'request_profile' in g:
+        wall, profile = _finish_request_profile(response.status_code)
+        response.headers['Server-Timing'] = (f'db;dur={profile["sql_time"] * 1000:.2f};desc="{profile["queries"]} queries", '
+                                             f'total;dur={wall * 1000:.2f}')
+    return response
+
+@app.teardown_request
+def _record_failed_request_profile(error):
+    # after_request is skipped when a view raises
+    if 'request_profile' in g: _finish_request_profile(500)
 
 # ----------------- CORE & AUTHENTICATION ROUTES -----------------
 @app.route('/')
@@ -119,6 +1598,7 @@ def login():
     user = User.query.filter_by(email=data.get('email')).first()
     if user and bcrypt.check_password_hash(user.password, data.get('password')) and user.role == data.get('role'):
         session.clear(); session['user_id'] = user.id; session['name'] = user.name; session['role'] = user.role
+        identity_cache.put(Identity(user.id, user.role, user.name))
         return jsonify({'success': True, 'redirect_url': url_for(f"{user.role}_dashboard")})
     return jsonify({'success': False, 'message': 'Invalid credentials or role mismatch.'})
 
@@ -132,7 +1612,7 @@ def signup():
     if new_user.role == 'member':
         trainer = User.query.filter_by(role='trainer').first()
         if trainer: trainer.clients.append(new_user)
-    db.session.commit(); log_activity(new_user.name, f"registered as a new {new_user.role}."); db.session.commit()
+    db.session.flush(); log_activity(new_user.name, f"registered as a new {new_user.role}.", new_user.id); db.session.commit()
     return jsonify({'success': True, 'message': 'Account created! Please log in.'})
 
 @app.route('/logout')
@@ -141,100 +1621,81 @@ def logout():
 
 # ----------------- DASHBOARD & FUNCTIONAL ROUTES -----------------
 @app.route('/member_dashboard')
+@role_required('member')
 def member_dashboard():
     user = get_current_user()
-    if not user or user.role != 'member': return redirect(url_for('home'))
-    attended_dates = {b.booking_date.date().isoformat() for b in user.bookings.filter_by(status='ATTENDED').all()}
+    if not user: return redirect(url_for('home'))
+    attended_dates = {b.booking_date.date().isoformat() for b in Booking.query.filter_by(user_id=user.id, status='ATTENDED').all()}
     return render_template('member_dashboard.html', user=user, attended_dates=list(attended_dates))
 
 @app.route('/trainer_dashboard')
+@role_required('trainer')
 def trainer_dashboard():
-    trainer = get_current_user()
-    if not trainer or trainer.role != 'trainer':
-        return redirect(url_for('home'))
-
-    # Fetch clients assigned to this trainer
-    clients = trainer.clients.order_by(User.name).all()
-    client_ids = [c.id for c in clients]
+    trainer = get_current_identity()
 
-    # Calculate stats
-    upcoming_classes_count = Booking.query.filter(
-        Booking.user_id.in_(client_ids),
-        func.date(Booking.booking_date) >= datetime.date.today()
-    ).distinct(Booking.class_id).count()
+    # Fetch clients assigned to this trainer; everything else comes from the cached aggregates
+    clients = User.query.filter(User.id.in_(_client_ids_of(trainer.id))).order_by(User.name).all()
+    data = get_trainer_dashboard_data(trainer.id, clients)
 
     stats = {
         'active_clients': len(clients),
-        'upcoming_classes': upcoming_classes_count,
-        'training_plans': WorkoutPlan.query.filter(WorkoutPlan.member_id.in_(client_ids)).count()
+        'upcoming_classes': data['upcoming_classes'],
+        'training_plans': data['training_plans']
     }
-
-    
-    client_names = [c.name for c in clients]
-    activities_raw = ActivityLog.query.filter(ActivityLog.user_name.in_(client_names)).order_by(desc(ActivityLog.timestamp)).limit(5).all()
-    activities = [{'user': log.user_name, 'action': log.message, 'time': time_ago(log.timestamp)} for log in activities_raw]
-
     # Add last active time to each client object
     for client in clients:
-        last_booking = client.bookings.order_by(desc(Booking.booking_date)).first()
-        client.last_active = time_ago(last_booking.booking_date) if last_booking else "No activity"
+        last_booking_date = data['last_booking'].get(client.id)
+        client.last_active = time_ago(last_booking_date) if last_booking_date else "No activity"
 
     return render_template(
         'trainer_dashboard.html',
         trainer=trainer,
         stats=stats,
-        clients=clients,
-        activities=activities
+        clients=clients
     )
 
 @app.route('/admin_dashboard')
+@role_required('admin')
 def admin_dashboard():
-    user = get_current_user()
-    if not user or user.role != 'admin':
-        return redirect(url_for('home'))
+    user = get_current_identity()
 
+    total_revenue, revenue_data = revenue_overview()
+    catalog, class_grid = class_catalog.fragment('admin_class_grid')
     stats = {
         'total_members': User.query.filter_by(role='member').count(),
-        'active_classes': Class.query.count(),
-        'total_revenue': 86600
+        'active_classes': len(catalog['classes']),
+        'total_revenue': total_revenue
     }
-    logs_raw = ActivityLog.query.order_by(desc(ActivityLog.timestamp)).limit(5).all()
-    activity_logs = [{'user': log.user_name, 'action': log.message, 'time': time_ago(log.timestamp)} for log in logs_raw]
-    users_list = User.query.order_by(User.role, User.name).all()
-    revenue_data = {'Jan': 5000, 'Feb': 5500, 'Mar': 9000, 'Apr': 15000, 'May': 22000, 'Jun': 25100}
-    classes = Class.query.all()
 
     return render_template(
         'admin_dashboard.html',
         admin=user,
         stats=stats,
-        activities=activity_logs,
-        users_list=users_list,
         revenue_data=revenue_data,
-        classes=classes
+        class_grid=class_grid
     )
 
 @app.route('/admin/view_user/<int:user_id>')
+@role_required('admin', denied='forbidden')
 def admin_view_user(user_id):
-    admin = get_current_user()
-    if not admin or admin.role != 'admin':
-        return "Unauthorized", 403
     user_to_view = User.query.get_or_404(user_id)
-    weight_history = sorted(user_to_view.weight_logs, key=lambda x: x.date, reverse=True)
+    weight_history = WeightLog.query.filter_by(user_id=user_id).order_by(desc(WeightLog.date)).limit(WEIGHT_HISTORY_ROWS).all()
     attended_dates = {b.booking_date.date().isoformat() for b in user_to_view.bookings.filter_by(status='ATTENDED').all()}
-    all_bookings = user_to_view.bookings.join(Class).order_by(desc(Booking.booking_date)).all()
+    all_bookings = user_to_view.bookings.join(Class).options(contains_eager(Booking.class_info)).order_by(desc(Booking.booking_date)).all()
     workout_plans = user_to_view.workout_plans.order_by(desc(WorkoutPlan.assigned_date)).all()
     return render_template('admin_view_user.html', client=user_to_view, weight_history=weight_history, attended_dates=list(attended_dates), all_bookings=all_bookings, workout_plans=workout_plans)
 
 @app.route('/view_client/<int:client_id>')
+@role_required('trainer', denied='forbidden')
 def view_client(client_id):
-    trainer = get_current_user()
+    trainer = get_current_identity()
+    if not is_trainer_of(trainer.id, client_id): return "Unauthorized", 403
     client = User.query.get_or_404(client_id)
-    if not trainer or trainer.role != 'trainer' or client not in trainer.clients:
-        return "Unauthorized", 403
-    weight_history = sorted(client.weight_logs, key=lambda x: x.date, reverse=True)
+    weight_history = WeightLog.query.filter_by(user_id=client_id).order_by(desc(WeightLog.date)).limit(WEIGHT_HISTORY_ROWS).all()
     attended_dates = {b.booking_date.date().isoformat() for b in client.bookings.filter_by(status='ATTENDED').all()}
-    todays_bookings = Booking.query.filter(Booking.user_id == client_id, func.date(Booking.booking_date) == datetime.date.today()).all()
+    day_start, day_end = day_bounds(datetime.date.today())
+    todays_bookings = (Booking.query.options(joinedload(Booking.class_info))
+                       .filter(Booking.user_id == client_id, Booking.booking_date >= day_start, Booking.booking_date < day_end).all())
     return render_template('view_client_details.html', client=client, weight_history=weight_history, attended_dates=list(attended_dates), todays_bookings=todays_bookings)
 
 @app.route('/workout')
@@ -242,17 +1703,16 @@ def workout():
     return render_template('workout.html')
 
 @app.route('/class_booking')
+@login_required
 def class_booking():
-    user = get_current_user()
-    if not user: return redirect(url_for('home'))
-    return render_template('class_booking.html', classes=Class.query.all())
+    _, class_grid = class_catalog.fragment('booking_class_grid')
+    return render_template('class_booking.html', class_grid=class_grid)
 
 # ----------------- API ROUTES (FOR JS) -----------------
 @app.route('/api/remove_user/<int:user_id>', methods=['POST'])
+@role_required('admin', denied='json')
 def remove_user(user_id):
-    admin = get_current_user()
-    if not admin or admin.role != 'admin':
-        return jsonify({'success': False, 'message': 'Unauthorized access.'}), 403
+    admin = get_current_identity()
     if admin.id == user_id:
         return jsonify({'success': False, 'message': 'You cannot remove your own account.'}), 400
     user_to_delete = User.query.get(user_id)
@@ -260,65 +1720,243 @@ def remove_user(user_id):
         return jsonify({'success': False, 'message': 'User not found.'}), 404
     try:
         user_name = user_to_delete.name
+        booked_class_ids = [class_id for class_id, in db.session.query(Booking.class_id).filter(Booking.user_id == user_id)]
         db.session.delete(user_to_delete)
-        log_activity(admin.name, f"removed user '{user_name}' (ID: {user_id}).")
+        log_activity(admin.name, f"removed user '{user_name}' (ID: {user_id}).", admin.id)
+        db.session.flush()
+        # Seats released by the cascaded bookings go to each class's waitlist, not to whoever books next
+        for class_id in booked_class_ids: promote_waitlist(class_id)
         db.session.commit()
         return jsonify({'success': True, 'message': f"User '{user_name}' has been successfully removed."})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': 'An error occurred while removing the user.'}), 500
 
+def user_directory_query(role=None, search='', after=None):
+    # Keyset page of the user directory ordered by (role, name, id); `after` is the decoded cursor.
+    # Within one role only (name, id) is compared, so the planner range-scans ix_users_role_name.
+    query = db.session.query(User.id, User.name, User.email, User.role)
+    if role: query = query.filter(User.role == role)
+    if search: query = query.filter(or_(prefix_match(User.name, search), prefix_match(User.email, search)))
+    if after:
+        after_role, after_name, after_id = after
+        if role: query = query.filter(tuple_(User.name, User.id) > tuple_(after_name, after_id))
+        else: query = query.filter(tuple_(User.role, User.name, User.id) > tuple_(after_role, after_name, after_id))
+    return query.order_by(User.role, User.name, User.id)
+
+@app.route('/api/admin/users')
+@role_required('admin', denied='json')
+def api_admin_users():
+    # `after` is the opaque cursor of the previous page
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    role = request.args.get('role'); search = request.args.get('q', '').strip(); cursor = request.args.get('after')
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+            if not (isinstance(after, list) and len(after) == 3 and isinstance(after[0], str) and isinstance(after[1], str)
+                    and type(after[2]) is int): raise ValueError(cursor)
+        except (ValueError, TypeError):
+            return jsonify({'success': False, 'message': 'Invalid cursor.'}), 400
+    rows = user_directory_query(role, search, after).limit(limit + 1).all()
+    page = rows[:limit]
+    users = [{'id': u.id, 'name': u.name, 'email': u.email, 'role': u.role,
+              'view_url': url_for('admin_view_user', user_id=u.id)} for u in page]
+    next_cursor = encode_cursor([page[-1].role, page[-1].name, page[-1].id]) if len(rows) > limit else None
+    return jsonify({'success': True, 'users': users, 'next_cursor': next_cursor})
+
+@app.route('/api/admin/record_payment', methods=['POST'])
+@role_required('admin', denied='json')
+def api_record_payment():
+    admin = get_current_identity()
+    data = request.json or {}
+    member = User.query.get(data.get('user_id'))
+    try:
+        amount_cents = int(round(float(data.get('amount')) * 100)); months = int(data.get('months', 1))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid amount.'}), 400
+    if not member or amount_cents <= 0 or months <= 0:
+        return jsonify({'success': False, 'message': 'Invalid data'}), 400
+    plan = data.get('plan')
+    record_payment(member.id, amount_cents, data.get('description') or (f"{plan} membership" if plan else 'Payment'), plan=plan, months=months)
+    log_activity(admin.name, f"recorded a payment of ${amount_cents / 100:,.2f} from {member.name}.", admin.id); db.session.commit()
+    return jsonify({'success': True, 'message': 'Payment recorded.'})
+
+@app.route('/api/activity_stream')
+@role_required('admin', 'trainer', denied='json')
+def activity_stream():
+    # Server-sent events: admins see every entry, trainers only entries whose actor is one of their clients
+    user = get_current_identity()
+    client_ids = None
+    if user.role == 'trainer':
+        client_ids = {row[0] for row in db.session.execute(_client_ids_of(user.id))}
+    last_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('after', type=int)
+    backlog = request.args.get('backlog', 5, type=int)
+    keepalive = app.config['ACTIVITY_FEED_KEEPALIVE']; max_age = app.config['ACTIVITY_STREAM_MAX_AGE']
+    db.session.remove()  # the stream itself never touches the database
+
+    def visible(entry):
+        return client_ids is None or entry['user_id'] in client_ids
+
+    def stream():
+        activity_feed.subscribe()
+        try:
+            events = activity_feed.wait_for_events(-1, timeout=0)
+            after_seq = events[-1]['seq'] if events else 0
+            if last_id is None: replay = [e for e in events if visible(e)][-backlog:] if backlog > 0 else []
+            else: replay = [e for e in events if e['id'] > last_id and visible(e)]
+            for entry in replay:
+                yield format_activity_event(entry)
+            yield "retry: 5000\n\n"
+            # Bounded so an open tab does not hold a worker thread forever; the browser reconnects
+            # with Last-Event-ID and the buffer replays what it missed
+            deadline = time.monotonic() + max_age
+            while time.monotonic() < deadline:
+                events = activity_feed.wait_for_events(after_seq, timeout=keepalive)
+                if not events:
+                    yield ": keep-alive\n\n"; continue
+                after_seq = events[-1]['seq']
+                for entry in events:
+                    if visible(entry): yield format_activity_event(entry)
+        finally:
+            activity_feed.unsubscribe()
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/measurements', methods=['GET', 'POST', 'DELETE'])
+@role_required(denied='json')
+def api_measurements():
+    user = get_current_identity()
+    if request.method == 'POST':
+        data = request.json or {}
+        try:
+            weight = float(data.get('weight_kg')); height = float(data['height_m']) if data.get('height_m') else None
+        except (TypeError, ValueError):
+            weight = height = -1
+        if weight <= 0 or (height is not None and height <= 0):
+            return jsonify({'success': False, 'message': 'Please enter valid height and weight.'}), 400
+        bmi = weight / (height * height) if height else None
+        db.session.add(Measurement(user_id=user.id, weight_kg=weight, height_m=height, bmi=bmi)); db.session.commit()
+        return jsonify({'success': True, 'bmi': bmi, 'status': bmi_status(bmi) if bmi else None})
+    if request.method == 'DELETE':
+        Measurement.query.filter_by(user_id=user.id).delete(); db.session.commit()
+        return jsonify({'success': True, 'message': 'Measurement history cleared.'})
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    rows = Measurement.query.filter_by(user_id=user.id).order_by(desc(Measurement.taken_at)).limit(limit).all()
+    return jsonify({'success': True, 'measurements': [
+        {'date': m.taken_at.isoformat(), 'weight_kg': m.weight_kg, 'height_m': m.height_m, 'bmi': m.bmi,
+         'status': bmi_status(m.bmi) if m.bmi else None} for m in rows]})
+
+@app.route('/api/users/<int:user_id>/series')
+@role_required(denied='json')
+def api_measurement_series(user_id):
+    # ?metric=weight|bmi&start=&end=(YYYY-MM-DD)&bucket=day|week|month&points=N&unit=kg|lb
+    # The response's bucket is the one actually used, which is coarser when the range needs more than N points
+    identity = get_current_identity()
+    if identity.id != user_id and identity.role != 'admin' and not (identity.role == 'trainer' and is_trainer_of(identity.id, user_id)):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    metric = request.args.get('metric', 'weight'); bucket = request.args.get('bucket') or None; unit = request.args.get('unit', 'kg')
+    try:
+        start, end = parse_day(request.args.get('start')), parse_day(request.args.get('end'))
+    except ValueError:
+        start = end = False
+    if start is False or metric not in ('weight', 'bmi') or unit not in ('kg', 'lb') or bucket not in (None, 'day', 'week', 'month'):
+        return jsonify({'success': False, 'message': 'Invalid data'}), 400
+    max_points = max(3, min(request.args.get('points', 200, type=int), SERIES_MAX_POINTS))
+    scale = 1 / LB_TO_KG if metric == 'weight' and unit == 'lb' else 1
+    series, bucket = measurement_series(user_id, metric, start, end, bucket, max_points)
+    for point in series:
+        point['date'] = epoch_to_iso(point.pop('epoch'))
+        for key in ('value', 'min', 'max'):
+            if key in point: point[key] = round(point[key] * scale, 2)
+    return jsonify({'success': True, 'metric': metric, 'unit': unit if metric == 'weight' else None, 'bucket': bucket, 'points': series})
+
+@app.route('/api/trainer/cohort_progress')
+@role_required('trainer', denied='json')
+def api_cohort_progress():
+    try:
+        since = parse_day(request.args.get('since'))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid data'}), 400
+    clients = []
+    for row in cohort_progress(get_current_identity().id, since):
+        start_weight, latest_weight = row['start_weight_kg'], row['latest_weight_kg']
+        clients.append({
+            'id': row['id'], 'name': row['name'], 'goal': row['goal'], 'measurements': row['measurements'] or 0,
+            'start_weight_kg': start_weight, 'latest_weight_kg': latest_weight,
+            'weight_change_kg': round(latest_weight - start_weight, 2) if start_weight is not None else None,
+            'start_bmi': row['start_bmi'], 'latest_bmi': row['latest_bmi'],
+            'first_date': epoch_to_iso(row['first_epoch']) if row['first_epoch'] is not None else None,
+            'last_date': epoch_to_iso(row['last_epoch']) if row['last_epoch'] is not None else None,
+        })
+    changes = [c['weight_change_kg'] for c in clients if c['weight_change_kg'] is not None]
+    summary = {'clients': len(clients), 'tracked_clients': len(changes),
+               'average_weight_change_kg': round(sum(changes) / len(changes), 2) if changes else None}
+    return jsonify({'success': True, 'summary': summary, 'clients': clients})
+
+@app.route('/api/classes')
+@role_required(denied='json')
+def api_classes():
+    entry = class_catalog.get()
+    return catalog_response(Response(entry['json'], mimetype='application/json'), entry)
+
+@app.route('/api/classes/availability')
+@role_required(denied='json')
+def api_class_availability():
+    # Live seat counts only; the rest of the catalog is served (and cached) by /api/classes
+    rows = db.session.query(Class.id, Class.capacity, Class.booked_count).all()
+    response = jsonify({str(class_id): {'capacity': capacity, 'booked': booked, 'available': max(capacity - booked, 0)}
+                        for class_id, capacity, booked in rows})
+    response.cache_control.no_store = True
+    return response
+
 @app.route('/api/book_class', methods=['POST'])
+@role_required(denied='json')
 def api_book_class():
-    user = get_current_user()
-    if not user: return jsonify({'success': False, 'message': 'Not logged in'}), 401
-    class_id = request.json.get('class_id')
-    if Booking.query.filter_by(user_id=user.id, class_id=class_id).first():
-        return jsonify({'success': False, 'message': 'Already booked'})
-    target_class = Class.query.get(class_id)
-    if target_class.bookings.count() >= target_class.capacity:
-        db.session.add(Waitlist(user_id=user.id, class_id=class_id))
-        log_activity(user.name, f"joined waitlist for '{target_class.name}'.")
-        db.session.commit()
-        return jsonify({'success': True, 'message': 'Class is full. You have been added to the waitlist.'})
-    db.session.add(Booking(user_id=user.id, class_id=class_id)); log_activity(user.name, f"booked '{target_class.name}'."); db.session.commit()
-    return jsonify({'success': True, 'message': 'Booked Successfully!'})
+    user = get_current_identity()
+    result, status = book_class(user.id, user.name, request.json.get('class_id'))
+    return jsonify(result), status
 
 @app.route('/api/cancel_booking/<int:booking_id>', methods=['POST'])
+@role_required(denied='json')
 def api_cancel_booking(booking_id):
-    user = get_current_user()
-    if not user: return jsonify({'success': False, 'message': 'Not logged in'}), 401
+    user = get_current_identity()
     booking = Booking.query.get_or_404(booking_id)
     if booking.user_id != user.id and user.role != 'admin': return jsonify({'success': False, 'message': 'Unauthorized'}), 403
-    class_id = booking.class_id; class_name = booking.class_info.name
-    db.session.delete(booking); log_activity(booking.member.name, f"cancelled booking for '{class_name}'.")
-    first_waitlisted = Waitlist.query.filter_by(class_id=class_id).order_by(Waitlist.timestamp.asc()).first()
-    if first_waitlisted:
-        db.session.add(Booking(user_id=first_waitlisted.user_id, class_id=class_id))
-        log_activity(first_waitlisted.member.name, f"auto-booked for '{class_name}' from waitlist.")
-        db.session.delete(first_waitlisted)
-    db.session.commit()
+    if not cancel_booking(booking_id): return jsonify({'success': False, 'message': 'Booking not found.'}), 404
     return jsonify({'success': True, 'message': 'Booking cancelled successfully.'})
 
 @app.route('/api/assign_plan', methods=['POST'])
+@role_required('trainer', denied='json')
 def api_assign_plan():
-    trainer = get_current_user()
-    if not trainer or trainer.role != 'trainer': return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    trainer = get_current_identity()
     data = request.json
     new_plan = WorkoutPlan(member_id=data['member_id'], trainer_name=trainer.name, title=data['title'], description=data['description'])
-    db.session.add(new_plan); log_activity(trainer.name, f"assigned plan '{data['title']}' to member ID {data['member_id']}."); db.session.commit()
+    db.session.add(new_plan); log_activity(trainer.name, f"assigned plan '{data['title']}' to member ID {data['member_id']}.", trainer.id); db.session.commit()
     return jsonify({'success': True, 'message': 'Plan assigned successfully!'})
 
 @app.route('/api/mark_attendance', methods=['POST'])
+@role_required('trainer', denied='json')
 def api_mark_attendance():
-    trainer = get_current_user()
-    if not trainer or trainer.role != 'trainer': return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    trainer = get_current_identity()
     booking_id = request.form.get('booking_id'); status = request.form.get('status')
     booking = Booking.query.get(booking_id)
     if not booking or status not in ['ATTENDED', 'MISSED']: return jsonify({'success': False, 'message': 'Invalid data'}), 400
-    booking.status = status; log_activity(trainer.name, f"marked {booking.member.name} as {status.lower()} for '{booking.class_info.name}'"); db.session.commit()
+    booking.status = status; log_activity(trainer.name, f"marked {booking.member.name} as {status.lower()} for '{booking.class_info.name}'", trainer.id); db.session.commit()
     return jsonify({'success': True, 'message': 'Attendance updated'})
 
+@app.route('/admin/metrics')
+def admin_metrics():
+    # Admin session, or `Authorization: Bearer <METRICS_TOKEN>` for a Prometheus scraper
+    token = app.config['METRICS_TOKEN']
+    identity = get_current_identity()
+    bearer = request.headers.get('Authorization', '').encode()
+    if not (token and hmac.compare_digest(bearer, f'Bearer {token}'.encode())) and not (identity and identity.role == 'admin'):
+        return "Unauthorized", 403
+    if not app.config['PROFILING_ENABLED']: return "Instrumentation is disabled (set GYM_PROFILING=1).", 404
+    if request.args.get('format') == 'json': return jsonify({'slow_statements': request_metrics.slow_statements()})
+    return Response(request_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 
 @app.cli.command("init-db")
 def init_db_command():
@@ -352,10 +1990,233 @@ def init_db_command():
         if mara and spinning_class:
             db.session.add(Booking(member=mara, class_info=spinning_class, booking_date=datetime.datetime.today()))
             db.session.add(WorkoutPlan(member_id=mara.id, trainer_name="Sara Holmes", title="Beginner Cardio Plan", description="Start with 20 mins of treadmill, 3 times a week."))
-        log_activity('John Doe', 'logged a new weight'); log_activity('Mara Pinto', 'booked Spinning')
+        log_activity('John Doe', 'logged a new weight', john.id); log_activity('Mara Pinto', 'booked Spinning', mara.id)
+        # Six months of monthly membership fees for every member
+        for months_ago in range(5, -1, -1):
+            paid_at = datetime.datetime.utcnow() - datetime.timedelta(days=30 * months_ago)
+            for member in User.query.filter_by(role='member'):
+                db.session.add(Payment(user_id=member.id, amount_cents=4900, description='Monthly membership', paid_at=paid_at))
         db.session.commit()
         print("Database initialized successfully with sample data.")
 
+@app.cli.command("upgrade-db")
+def upgrade_db_command():
+    # Brings an existing gym.db up to the current schema without dropping data
+    with app.app_context():
+        db.create_all()
+        preparer = db.engine.dialect.identifier_preparer
+        for column in (Class.__table__.c.booked_count, User.__table__.c.created_at, ActivityLog.__table__.c.user_id):
+            if column.name not in {c['name'] for c in inspect(db.engine).get_columns(column.table.name)}:
+                # Column types are compiled for the connected dialect (DATETIME on SQLite, TIMESTAMP on PostgreSQL)
+                ddl = column.type.compile(dialect=db.engine.dialect)
+                if column.server_default is not None: ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+                db.session.execute(text(f"ALTER TABLE {preparer.format_table(column.table)} ADD COLUMN {preparer.quote(column.name)} {ddl}"))
+        for model in (Booking, Waitlist):
+            keep = select(func.min(model.id)).group_by(model.user_id, model.class_id)
+            removed = db.session.execute(delete(model).where(model.id.not_in(keep))).rowcount
+            if removed: print(f"Removed {removed} duplicate {model.__tablename__} rows.")
+            uq_name = f"uq_{model.__tablename__}_user_class"
+            # Databases created with the constraint already enforce it (SQLite keeps it in an autoindex);
+            # a second unique index would only be maintained on every write, so an earlier upgrade's copy is dropped
+            inspector = inspect(db.session.connection())
+            columns = {'user_id', 'class_id'}
+            constraints = [uc for uc in inspector.get_unique_constraints(model.__tablename__) if set(uc['column_names']) == columns]
+            indexes = [ix['name'] for ix in inspector.get_indexes(model.__tablename__)
+                       if ix['unique'] and set(ix['column_names']) == columns and not ix.get('duplicates_constraint')]
+            if not constraints and not indexes:
+                db.session.execute(text(f"CREATE UNIQUE INDEX {uq_name} ON {model.__tablename__} (user_id, class_id)"))
+            elif constraints and uq_name in indexes:
+                db.session.execute(text(f"DROP INDEX {uq_name}")); print(f"Dropped duplicate unique index {uq_name}.")
+        resync_seat_counters()
+        db.session.commit()
+        inspector = inspect(db.engine)
+        for table in db.metadata.sorted_tables:
+            existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda ix: ix.name):
+                if index.name not in existing:
+                    index.create(db.engine); print(f"Created index {index.name}.")
+        print("Database upgraded successfully. Run `flask backfill-rollups` to rebuild analytics.")
+
+@app.cli.command("backfill-rollups")
+def backfill_rollups_command():
+    with app.app_context():
+        start = time.perf_counter()
+        written = backfill_rollups()
+        print(f"Rebuilt {written} monthly rollup rows in {time.perf_counter() - start:.2f}s.")
+
+@app.cli.command("export-data")
+@click.argument('entity', type=click.Choice(list(DATA_FIELDS)))
+@click.argument('path', type=click.Path(dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=1000, show_default=True)
+def export_data_command(entity, path, fmt, chunk_size):
+    with app.app_context():
+        start = time.perf_counter()
+        written = write_records(path, data_format(path, fmt), DATA_FIELDS[entity], export_records(entity, chunk_size))
+        elapsed = time.perf_counter() - start
+        print(f"Exported {written} {entity} rows to {path} in {elapsed:.2f}s ({written / max(elapsed, 1e-9):,.0f} rows/sec).")
+
+@app.cli.command("import-data")
+@click.argument('entity', type=click.Choice(list(DATA_FIELDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Processes hashing plain-text passwords.')
+@click.option('--restart', is_flag=True, help='Ignore the progress of an earlier run of this file.')
+def import_data_command(entity, path, fmt, batch_size, workers, restart):
+    with app.app_context():
+        source = os.path.abspath(path)
+        job = ImportJob.query.filter_by(entity=entity, source=source).first() or ImportJob(entity=entity, source=source, rows_done=0)
+        if restart: job.rows_done = 0; job.finished_at = None
+        if job.finished_at:
+            print(f"{path} was already imported on {job.finished_at:%Y-%m-%d %H:%M}; pass --restart to import it again."); return
+        db.session.add(job); db.session.commit()
+        if job.rows_done: print(f"Resuming after {job.rows_done} rows.")
+        records = itertools.islice(read_records(path, data_format(path, fmt)), job.rows_done, None)
+        pool = ProcessPoolExecutor(max_workers=workers) if entity == 'users' and workers > 1 else None
+        start = time.perf_counter(); processed = skipped = duplicates = 0
+        try:
+            while True:
+                batch = list(itertools.islice(records, batch_size))
+                if not batch: break
+                invalid, repeated = import_batch(entity, batch, pool)
+                skipped += invalid; duplicates += repeated
+                job.rows_done += len(batch); processed += len(batch)
+                db.session.commit()
+                elapsed = time.perf_counter() - start
+                print(f"{entity}: {job.rows_done} rows done ({processed / max(elapsed, 1e-9):,.0f} rows/sec)")
+        finally:
+            if pool: pool.shutdown()
+        if entity == 'users':
+            import_trainer_links(read_records(path, data_format(path, fmt)), batch_size)
+        job.finished_at = datetime.datetime.utcnow(); db.session.commit()
+        moved = full_classes = 0
+        if entity == 'bookings':
+            moved, full_classes = waitlist_overbooked_classes(batch_size)
+        if entity in ('users', 'bookings'):
+            resync_seat_counters(); db.session.commit(); backfill_rollups()
+        elapsed = time.perf_counter() - start
+        print(f"Processed {processed} {entity} rows ({skipped} invalid skipped, {duplicates} duplicates skipped) in {elapsed:.2f}s "
+              f"({processed / max(elapsed, 1e-9):,.0f} rows/sec).")
+        if moved: print(f"Moved {moved} bookings past capacity in {full_classes} classes to their waitlists.")
+
+@app.cli.command("generate-data")
+@click.option('--members', default=2000, show_default=True)
+@click.option('--trainers', default=20, show_default=True)
+@click.option('--classes', default=40, show_default=True)
+@click.option('--bookings', default=30000, show_default=True, help='Capped at half of all (member, class) pairs.')
+@click.option('--waitlist', default=2000, show_default=True)
+@click.option('--weight-logs', default=40000, show_default=True)
+@click.option('--activity', default=50000, show_default=True, help='ActivityLog rows.')
+@click.option('--plans', default=1000, show_default=True, help='Workout plans assigned to trainers\' clients.')
+@click.option('--months', default=12, show_default=True, help='History covered by signups, bookings and payments.')
+@click.option('--seed', default=42, show_default=True, help='Same seed and sizes give the same database.')
+@click.option('--password', default='password', show_default=True, help='Password shared by every generated account.')
+@click.confirmation_option(prompt='This drops every table in the configured database. Continue?')
+def generate_data_command(**sizes):
+    with app.app_context():
+        start = time.perf_counter()
+        counts = generate_gym_data(**sizes)
+        print(", ".join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items()))
+        print(f"Generated in {time.perf_counter() - start:.2f}s. Sign in as admin@gym.test, trainer0@gym.test or member0@gym.test "
+              f"with password '{sizes['password']}'.")
+
+def _dashboard_queries(trainer_id, member_id, class_id):
+    day_start, day_end = day_bounds(datetime.date.today())
+    member_email = db.session.query(User.email).filter(User.id == member_id).scalar() or 'a'  # a selective search term
+    queries = [
+        ('member_dashboard: attended bookings', Booking.query.filter_by(user_id=member_id, status='ATTENDED')),
+        ('trainer_dashboard: client list', User.query.join(trainer_client_association, trainer_client_association.c.client_id == User.id)
+                                           .filter(trainer_client_association.c.trainer_id == trainer_id).order_by(User.name)),
+    ]
+    queries += [(f'trainer_dashboard: {name}', q) for name, q in _trainer_dashboard_queries(trainer_id).items()]
+    queries += [
+        ('admin_dashboard: member count', db.session.query(func.count(User.id)).filter(User.role == 'member')),
+        ('activity_feed: tail', ActivityLog.query.filter(ActivityLog.id > 0).order_by(ActivityLog.id).limit(app.config['ACTIVITY_FEED_SIZE'])),
+        ('admin users api: first page', user_directory_query().limit(51)),
+        ('admin users api: deep page', user_directory_query(after=('member', 'M', 0)).limit(51)),
+        ('admin users api: deep page within a role', user_directory_query('member', after=('member', 'M', 0)).limit(51)),
+        ('admin users api: search', user_directory_query(search=member_email).limit(51)),
+        ('admin users api: search within a role', user_directory_query('member', search=member_email).limit(51)),
+        ('view_user: weight history', WeightLog.query.filter_by(user_id=member_id).order_by(desc(WeightLog.date))),
+        ('view_user: bookings', Booking.query.filter_by(user_id=member_id).join(Class).order_by(desc(Booking.booking_date))),
+        ('view_user: workout plans', WorkoutPlan.query.filter_by(member_id=member_id).order_by(desc(WorkoutPlan.assigned_date))),
+        ('view_client: todays bookings', Booking.query.filter(Booking.user_id == member_id, Booking.booking_date >= day_start, Booking.booking_date < day_end)),
+        ('book_class: existing booking', Booking.query.filter_by(user_id=member_id, class_id=class_id)),
+        ('cancel_booking: waitlist head', Waitlist.query.filter_by(class_id=class_id).order_by(Waitlist.timestamp.asc(), Waitlist.id.asc()).limit(1)),
+    ]
+    return queries
+
+@app.cli.command("explain-dashboards")
+def explain_dashboards_command():
+    # Query plan for every dashboard/booking hot-path query (EXPLAIN QUERY PLAN on SQLite, EXPLAIN on PostgreSQL)
+    with app.app_context():
+        trainer = User.query.filter_by(role='trainer').first(); member = User.query.filter_by(role='member').first(); gym_class = Class.query.first()
+        sqlite = db.engine.dialect.name == 'sqlite'
+        full_scans = 0
+        for label, query in _dashboard_queries(trainer.id if trainer else 0, member.id if member else 0, gym_class.id if gym_class else 0):
+            sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+            if db.engine.dialect.paramstyle in ('format', 'pyformat'): sql = sql.replace('%%', '%')  # no parameters are bound
+            print(label)
+            for row in db.session.execute(text(('EXPLAIN QUERY PLAN ' if sqlite else 'EXPLAIN ') + sql)):
+                detail = row[-1]
+                if sqlite: flag = '  <-- full scan' if detail.startswith('SCAN') and 'INDEX' not in detail else ''
+                else: flag = '  <-- full scan' if 'Seq Scan' in detail else ''
+                full_scans += bool(flag)
+                print(f"    {detail}{flag}")
+        print(f"{full_scans} full table scan(s).")
+
+def _cold_query_count(client, user, method, path, payload=None):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user.id; sess['role'] = user.role
+    # Every check starts cold: the budgets cover the uncached path
+    # The CLI app context (and its flask.g) is shared with test-client requests
+    g.pop('identity', None); identity_cache.invalidate([user.id]); class_catalog.invalidate()
+    invalidate_trainer_dashboards()
+    request_metrics.reset()
+    response = client.open(path, method=method, json=payload)
+    (endpoint, stats), = request_metrics.endpoints.items()
+    return endpoint, int(stats['queries'].sum), response.status_code
+
+@app.cli.command("check-query-budgets")
+@click.option('--include-writes', is_flag=True, help='Also book and then cancel a class as a member (use a scratch database).')
+def check_query_budgets_command(include_writes):
+    # Cold-cache SQL statement counts for the hot pages, checked against QUERY_BUDGETS; exits 1 on a regression
+    with app.app_context():
+        admin = User.query.filter_by(role='admin').first()
+        trainer = User.query.join(trainer_client_association, trainer_client_association.c.trainer_id == User.id).filter(User.role == 'trainer').first()
+        member = db.session.get(User, db.session.execute(_client_ids_of(trainer.id).limit(1)).scalar()) if trainer else None
+        if not (admin and trainer and member):
+            raise click.ClickException("Needs an admin and a trainer with at least one client (e.g. `flask init-db`).")
+        gym_class = Class.query.filter(Class.booked_count < Class.capacity,
+                                       Class.id.not_in(select(Booking.class_id).where(Booking.user_id == member.id))).first()
+        admin, trainer, member = (Identity(u.id, u.role, u.name) for u in (admin, trainer, member))
+    checks = [(member, 'GET', '/member_dashboard'), (trainer, 'GET', '/trainer_dashboard'), (admin, 'GET', '/admin_dashboard'),
+              (admin, 'GET', f'/admin/view_user/{member.id}'), (trainer, 'GET', f'/view_client/{member.id}'),
+              (member, 'GET', '/class_booking')]
+    enabled, app.config['PROFILING_ENABLED'] = app.config['PROFILING_ENABLED'], True
+    client = app.test_client()
+    results = []
+    try:
+        results += [_cold_query_count(client, *check) for check in checks]
+        if include_writes and gym_class:
+            results.append(_cold_query_count(client, member, 'POST', '/api/book_class', {'class_id': gym_class.id}))
+            with app.app_context():
+                booking_id = Booking.query.filter_by(user_id=member.id, class_id=gym_class.id).first().id
+            results.append(_cold_query_count(client, member, 'POST', f'/api/cancel_booking/{booking_id}'))
+    finally:
+        app.config['PROFILING_ENABLED'] = enabled
+    failures = 0
+    for endpoint, queries, status in results:
+        budget = app.config['QUERY_BUDGETS'].get(endpoint)
+        failed = status >= 400 or (budget is not None and queries > budget)
+        failures += failed
+        print(f"{'FAIL' if failed else 'ok':4}  {endpoint:20} {queries:3} queries (budget {budget if budget is not None else '-'}, HTTP {status})")
+    if failures: raise SystemExit(1)
+    print("All endpoints are within their query budgets.")
+
 # ----------------- Main Execution -----------------
+# Development server only; see README.md for running several worker processes under gunicorn.
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    app.run(host=os.environ.get('HOST', '127.0.0.1'), port=int(os.environ.get('PORT', 5001)),
+            debug=os.environ.get('FLASK_DEBUG', '1') == '1')
\ No newline at end of file
@@ -0,0 +1,106 @@
+# ==============================================================================
+# ANALYTICS BENCHMARK
+# Grows a scratch database to a few million synthetic bookings (plus payments) in
+# steps, rebuilds the monthly rollups after each step, and times the admin dashboard
+# against a direct aggregate over the transactional tables.
+#
+#   python benchmark_analytics.py --steps 100000,1000000,3000000
+# ==============================================================================
+
+import os
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+import statistics
+from sqlalchemy import func
+
+parser = argparse.ArgumentParser(description='Admin dashboard latency as bookings grow.')
+parser.add_argument('--steps', default='100000,1000000,3000000', help='Cumulative booking counts to measure at.')
+parser.add_argument('--classes', type=int, default=200)
+parser.add_argument('--months', type=int, default=36, help='Spread of synthetic booking/payment dates.')
+parser.add_argument('--runs', type=int, default=20, help='Dashboard requests timed per step.')
+parser.add_argument('--seed', type=int, default=7)
+args = parser.parse_args()
+
+scratch_dir = tempfile.mkdtemp(prefix='gym-bench-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(scratch_dir, 'bench.db')
+
+from app import app, db, User, Class, Booking, Payment, backfill_rollups, month_expr  # noqa: E402  (must follow DATABASE_URL)
+
+rng = random.Random(args.seed)
+now = datetime.datetime.utcnow()
+CHUNK = 50000
+
+def random_date():
+    return now - datetime.timedelta(minutes=rng.randrange(args.months * 30 * 24 * 60))
+
+def setup():
+    with app.app_context():
+        db.drop_all(); db.create_all()
+        admin = User(name='Bench Admin', email='admin@bench.local', password='!', role='admin')
+        db.session.add(admin)
+        db.session.add_all(Class(name=f'Class {i}', description='Synthetic', day='Mon', time='6:00 am', duration='60 min',
+                                 image_url='', capacity=10 ** 9) for i in range(args.classes))
+        db.session.commit()
+        return admin.id, [c.id for c in Class.query.all()]
+
+def grow(class_ids, start, target):
+    # Bookings are (member, class) pairs walked member-major, so the uniqueness constraint holds
+    with app.app_context():
+        conn = db.session.connection()
+        members_needed = -(-target // len(class_ids))
+        existing = User.query.filter_by(role='member').count()
+        if members_needed > existing:
+            conn.execute(User.__table__.insert(), [
+                {'name': f'Member {i}', 'email': f'member{i}@bench.local', 'password': '!', 'role': 'member', 'created_at': random_date()}
+                for i in range(existing, members_needed)])
+        first_member = db.session.query(func.min(User.id)).filter(User.role == 'member').scalar()
+        for chunk_start in range(start, target, CHUNK):
+            bookings, payments = [], []
+            for n in range(chunk_start, min(chunk_start + CHUNK, target)):
+                member_id = first_member + n // len(class_ids)
+                bookings.append({'user_id': member_id, 'class_id': class_ids[n % len(class_ids)], 'booking_date': random_date(),
+                                 'status': rng.choice(('BOOKED', 'ATTENDED', 'ATTENDED', 'MISSED'))})
+                if n % 10 == 0:
+                    payments.append({'user_id': member_id, 'amount_cents': 4900, 'description': 'Monthly membership', 'paid_at': random_date()})
+            conn.execute(Booking.__table__.insert(), bookings)
+            conn.execute(Payment.__table__.insert(), payments)
+        db.session.commit()
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter(); fn(); samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 2)
+
+def direct_aggregate():
+    # What the dashboard would cost without rollups: scan payments and bookings per request
+    with app.app_context():
+        db.session.query(month_expr(Payment.paid_at), func.sum(Payment.amount_cents)).group_by(month_expr(Payment.paid_at)).all()
+        db.session.query(month_expr(Booking.booking_date), func.count(Booking.id)).group_by(month_expr(Booking.booking_date)).all()
+
+if __name__ == '__main__':
+    admin_id, class_ids = setup()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = admin_id; sess['role'] = 'admin'
+    results, previous = [], 0
+    for target in (int(step) for step in args.steps.split(',')):
+        start = time.perf_counter(); grow(class_ids, previous, target); load_seconds = time.perf_counter() - start
+        with app.app_context():
+            start = time.perf_counter(); rollup_rows = backfill_rollups(); backfill_seconds = time.perf_counter() - start
+        assert client.get('/admin_dashboard').status_code == 200
+        results.append({
+            'bookings': target,
+            'load_seconds': round(load_seconds, 2),
+            'backfill_seconds': round(backfill_seconds, 2),
+            'rollup_rows': rollup_rows,
+            'dashboard_p50_ms': timed(lambda: client.get('/admin_dashboard'), args.runs),
+            'direct_aggregate_p50_ms': timed(direct_aggregate, max(1, args.runs // 5)),
+        })
+        print(json.dumps(results[-1]), flush=True)
+        previous = target
+    print(json.dumps({'steps': results}, indent=2))
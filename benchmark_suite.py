@@ -0,0 +1,219 @@
+# ==============================================================================
+# BENCHMARK SUITE
+# Generates a synthetic gym (see `flask generate-data`) in a scratch database, then drives
+# login, the member/trainer/admin dashboards, view_client, booking and cancelling through
+# the Flask test client (or a running server with --base-url) and prints p50/p95/p99
+# latency and throughput per scenario as JSON, so runs can be compared across versions.
+#
+#   python benchmark_suite.py --members 5000 --bookings 100000 --output before.json
+#   python benchmark_suite.py --base-url http://127.0.0.1:5001 --database-url sqlite:///gym.db
+#
+# Data is only generated into the scratch default; with --database-url it takes --generate.
+# ==============================================================================
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func
+
+SCENARIOS = ('login', 'member_dashboard', 'trainer_dashboard', 'admin_dashboard', 'view_client', 'book', 'cancel')
+
+parser = argparse.ArgumentParser(description='Latency/throughput benchmark over a synthetic gym.')
+parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated subset of: ' + ', '.join(SCENARIOS))
+parser.add_argument('--requests', type=int, default=300, help='Measured requests per scenario.')
+parser.add_argument('--warmup', type=int, default=30, help='Unmeasured requests per scenario, run first.')
+parser.add_argument('--login-requests', type=int, default=50, help='Measured logins; each one pays for a bcrypt check.')
+parser.add_argument('--threads', type=int, default=8)
+parser.add_argument('--base-url', help='Benchmark a running server instead of the in-process test client. It must share '
+                                       'SECRET_KEY and the database given by --database-url.')
+parser.add_argument('--database-url', help='Defaults to a throwaway SQLite file. The existing data is benchmarked as is '
+                                           'unless --generate is also given.')
+parser.add_argument('--generate', dest='generate', action='store_true', default=None,
+                    help='Replace the data at --database-url with a synthetic gym (drops every table). Always on for the scratch default.')
+parser.add_argument('--no-generate', dest='generate', action='store_false', help='Benchmark the existing data as is.')
+parser.add_argument('--members', type=int, default=2000)
+parser.add_argument('--trainers', type=int, default=20)
+parser.add_argument('--classes', type=int, default=40)
+parser.add_argument('--bookings', type=int, default=30000)
+parser.add_argument('--waitlist', type=int, default=2000)
+parser.add_argument('--weight-logs', type=int, default=40000)
+parser.add_argument('--activity', type=int, default=50000)
+parser.add_argument('--months', type=int, default=12)
+parser.add_argument('--password', default='password', help='Password of the generated accounts (used by the login scenario).')
+parser.add_argument('--seed', type=int, default=42)
+parser.add_argument('--output', help='Also write the JSON report to this file.')
+args = parser.parse_args()
+if args.generate is None: args.generate = not args.database_url  # never drop a database the caller pointed at without asking
+
+scratch_dir = tempfile.mkdtemp(prefix='gym-benchmark-')
+os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(scratch_dir, 'benchmark.db')
+
+from app import app, db, User, Class, Booking, trainer_client_association, generate_gym_data, activity_log_writer  # noqa: E402  (must follow DATABASE_URL)
+
+rng = random.Random(args.seed)
+signer = app.session_interface.get_signing_serializer(app)
+
+class TestClientDriver:
+    # One test client per thread; cookies are sent explicitly so the signed session decides who is calling
+    def __init__(self):
+        self.local = threading.local()
+
+    def send(self, method, path, cookie=None, form=None, json_body=None):
+        client = getattr(self.local, 'client', None)
+        if client is None: client = self.local.client = app.test_client(use_cookies=False)
+        headers = {'Cookie': f'session={cookie}'} if cookie else {}
+        return client.open(path, method=method, headers=headers, data=form, json=json_body).status_code
+
+class HttpDriver:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def send(self, method, path, cookie=None, form=None, json_body=None):
+        headers, data = {}, None
+        if cookie: headers['Cookie'] = f'session={cookie}'
+        if form is not None: data = urllib.parse.urlencode(form).encode(); headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if json_body is not None: data = json.dumps(json_body).encode(); headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read(); return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+def session_cookie(user_id, role):
+    return signer.dumps({'user_id': user_id, 'role': role})
+
+def load_actors():
+    with app.app_context():
+        admin = User.query.filter_by(role='admin').first()
+        members = db.session.query(User.id, User.email).filter(User.role == 'member').all()
+        clients = db.session.query(trainer_client_association.c.trainer_id, trainer_client_association.c.client_id).all()
+        class_ids = [c for c, in db.session.query(Class.id)]
+        # Bookings to cancel are drawn up front; each one can only be cancelled once
+        cancellable = db.session.query(Booking.id, Booking.user_id).order_by(func.random()).limit(args.requests + args.warmup).all()
+    return admin, members, clients, class_ids, cancellable
+
+def build_jobs(scenario, count, actors):
+    # A job is (method, path, cookie, form, json_body)
+    admin, members, clients, class_ids, cancellable = actors
+    jobs = []
+    for _ in range(count):
+        if scenario == 'login':
+            _, email = rng.choice(members)
+            jobs.append(('POST', '/login', None, {'email': email, 'password': args.password, 'role': 'member'}, None))
+        elif scenario == 'member_dashboard':
+            member_id, _ = rng.choice(members)
+            jobs.append(('GET', '/member_dashboard', session_cookie(member_id, 'member'), None, None))
+        elif scenario == 'trainer_dashboard':
+            trainer_id, _ = rng.choice(clients)
+            jobs.append(('GET', '/trainer_dashboard', session_cookie(trainer_id, 'trainer'), None, None))
+        elif scenario == 'admin_dashboard':
+            jobs.append(('GET', '/admin_dashboard', session_cookie(admin.id, 'admin'), None, None))
+        elif scenario == 'view_client':
+            trainer_id, client_id = rng.choice(clients)
+            jobs.append(('GET', f'/view_client/{client_id}', session_cookie(trainer_id, 'trainer'), None, None))
+        elif scenario == 'book':
+            member_id, _ = rng.choice(members)
+            jobs.append(('POST', '/api/book_class', session_cookie(member_id, 'member'), None, {'class_id': rng.choice(class_ids)}))
+        elif scenario == 'cancel':
+            if not cancellable: break
+            booking_id, member_id = cancellable.pop()
+            jobs.append(('POST', f'/api/cancel_booking/{booking_id}', session_cookie(member_id, 'member'), None, None))
+    return jobs
+
+def run(driver, jobs):
+    def timed(job):
+        start = time.perf_counter()
+        status = driver.send(*job)
+        return status, time.perf_counter() - start
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(timed, jobs))
+    return results, time.perf_counter() - start
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    return sorted_values[max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))]
+
+def summarize(results, elapsed):
+    latencies = sorted(seconds * 1000 for _, seconds in results)
+    statuses = {}
+    for status, _ in results: statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(results),
+        'errors': sum(1 for status, _ in results if status >= 400),
+        'status_counts': statuses,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(results) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(latencies[-1], 2),
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == '__main__':
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown: parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    dataset = None
+    if args.generate:
+        start = time.perf_counter()
+        with app.app_context():
+            dataset = generate_gym_data(members=args.members, trainers=args.trainers, classes=args.classes, bookings=args.bookings,
+                                        waitlist=args.waitlist, weight_logs=args.weight_logs, activity=args.activity,
+                                        months=args.months, seed=args.seed, password=args.password)
+        dataset['generate_seconds'] = round(time.perf_counter() - start, 2)
+        print(f"Generated dataset: {json.dumps(dataset)}", file=sys.stderr, flush=True)
+
+    actors = load_actors()
+    driver = HttpDriver(args.base_url) if args.base_url else TestClientDriver()
+    report = {'meta': {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'driver': 'http' if args.base_url else 'test_client',
+        'base_url': args.base_url,
+        'threads': args.threads, 'requests': args.requests, 'login_requests': args.login_requests, 'warmup': args.warmup,
+        'seed': args.seed,
+        'activity_log_async': app.config['ACTIVITY_LOG_ASYNC'],
+        'dataset': dataset,
+    }, 'scenarios': {}}
+    with app.app_context():
+        report['meta']['database'] = db.engine.dialect.name
+
+    for scenario in scenarios:
+        run(driver, build_jobs(scenario, args.warmup, actors))
+        results, elapsed = run(driver, build_jobs(scenario, args.login_requests if scenario == 'login' else args.requests, actors))
+        if not results:
+            report['scenarios'][scenario] = {'requests': 0, 'skipped': 'no data for this scenario'}; continue
+        report['scenarios'][scenario] = summarize(results, elapsed)
+        print(f"{scenario}: {json.dumps(report['scenarios'][scenario])}", file=sys.stderr, flush=True)
+    activity_log_writer.flush()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f: f.write(output + '\n')
+    sys.exit(1 if any(s.get('errors') for s in report['scenarios'].values()) else 0)
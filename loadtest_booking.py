@@ -0,0 +1,114 @@
+# ==============================================================================
+# BOOKING ENGINE LOAD TEST
+# Fires a burst of concurrent /api/book_class requests (one per member) at a single
+# class, then a burst of cancellations, and checks that the class is never overbooked
+# and that waitlist promotion keeps the seat counter consistent.
+#
+#   python loadtest_booking.py --members 1000 --capacity 50 --threads 16
+#   python loadtest_booking.py --activity-log sync   # compare with in-transaction logging
+#   python loadtest_booking.py --database-url postgresql+psycopg://gym@localhost/scratch --yes   # wipes that database
+# ==============================================================================
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func
+
+parser = argparse.ArgumentParser(description='Concurrent booking burst against a scratch database.')
+parser.add_argument('--members', type=int, default=1000)
+parser.add_argument('--capacity', type=int, default=50)
+parser.add_argument('--threads', type=int, default=16)
+parser.add_argument('--cancels', type=int, default=25)
+parser.add_argument('--activity-log', choices=('async', 'sync'), default='async', help='ActivityLog write path under test.')
+parser.add_argument('--database-url', help='Defaults to a throwaway SQLite file. Every table in it is dropped, so it needs --yes.')
+parser.add_argument('--yes', action='store_true', help='Confirm that the database at --database-url may be wiped.')
+args = parser.parse_args()
+if args.database_url and not args.yes:
+    parser.error('--database-url drops every table in that database; pass --yes to confirm')
+
+scratch_dir = tempfile.mkdtemp(prefix='gym-loadtest-')
+os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(scratch_dir, 'loadtest.db')
+
+from app import app, db, User, Class, Booking, Waitlist, ActivityLog, activity_log_writer, rollup_folder, rollup_months  # noqa: E402  (must follow DATABASE_URL)
+
+app.config['ACTIVITY_LOG_ASYNC'] = args.activity_log == 'async'
+
+def setup():
+    with app.app_context():
+        db.drop_all(); db.create_all()
+        gym_class = Class(name='Burst Class', description='Load test class', day='Mon', time='6:00 am',
+                          duration='60 min', image_url='', capacity=args.capacity)
+        db.session.add(gym_class)
+        # Sessions are injected directly, so a placeholder hash avoids paying bcrypt per member
+        members = [User(name=f'Member {i}', email=f'member{i}@loadtest.local', password='!', role='member') for i in range(args.members)]
+        db.session.add_all(members); db.session.commit()
+        return gym_class.id, [m.id for m in members]
+
+def call(user_id, method, path, kwargs):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id; sess['role'] = 'member'
+    start = time.perf_counter()
+    response = getattr(client, method)(path, **kwargs)
+    return response.status_code, response.get_json(), time.perf_counter() - start
+
+def burst(jobs):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(lambda job: call(*job), jobs))
+    return results, time.perf_counter() - start
+
+def summarize(results, elapsed):
+    latencies = sorted(r[2] for r in results)
+    return {
+        'requests': len(results),
+        'errors': sum(1 for r in results if r[0] >= 500),
+        'seconds': round(elapsed, 3),
+        'requests_per_sec': round(len(results) / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2),
+    }
+
+def check(class_id, expected_waitlist):
+    with app.app_context():
+        gym_class = Class.query.get(class_id)
+        bookings = Booking.query.filter_by(class_id=class_id).count()
+        distinct_members = db.session.query(func.count(func.distinct(Booking.user_id))).filter(Booking.class_id == class_id).scalar()
+        waitlisted = Waitlist.query.filter_by(class_id=class_id).count()
+        state = {'bookings': bookings, 'booked_count': gym_class.booked_count, 'waitlist': waitlisted}
+        ok = bookings == gym_class.capacity == gym_class.booked_count == distinct_members and waitlisted == expected_waitlist
+        return ok, state
+
+if __name__ == '__main__':
+    class_id, member_ids = setup()
+    results, elapsed = burst([(uid, 'post', '/api/book_class', {'json': {'class_id': class_id}}) for uid in member_ids])
+    book_ok, book_state = check(class_id, args.members - args.capacity)
+    report = {'booking_burst': dict(summarize(results, elapsed), **book_state,
+                                    booked=sum(1 for r in results if r[1] and r[1].get('message') == 'Booked Successfully!'))}
+
+    with app.app_context():
+        to_cancel = [(b.user_id, b.id) for b in Booking.query.filter_by(class_id=class_id).limit(args.cancels)]
+    results, elapsed = burst([(uid, 'post', f'/api/cancel_booking/{bid}', {}) for uid, bid in to_cancel])
+    cancel_ok, cancel_state = check(class_id, args.members - args.capacity - len(to_cancel))
+    report['cancel_burst'] = dict(summarize(results, elapsed), **cancel_state)
+    activity_log_writer.flush()
+    with app.app_context():
+        # One entry per booking/waitlist request, plus a cancellation and a promotion per cancel
+        logged = ActivityLog.query.count()
+    report['activity_log'] = {'mode': args.activity_log, 'rows': logged, 'expected': args.members + 2 * len(to_cancel)}
+    # Each cancellation is offset by a promotion, so the month's bookings end where the class did
+    with app.app_context():
+        pending = sum(r.bookings for r in rollup_months(class_id))
+    rollup_folder.fold()
+    with app.app_context():
+        folded = sum(r.bookings for r in rollup_months(class_id))
+    report['rollups'] = {'bookings_before_fold': pending, 'bookings_after_fold': folded, 'expected': args.capacity}
+    report['passed'] = (book_ok and cancel_ok and logged == args.members + 2 * len(to_cancel) and pending == folded == args.capacity
+                        and not any(r.get('errors') for r in report.values() if isinstance(r, dict)))
+
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report['passed'] else 1)
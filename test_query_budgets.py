@@ -0,0 +1,41 @@
+# ==============================================================================
+# QUERY BUDGETS
+# Seeds a small synthetic gym in a scratch SQLite database and runs `flask check-query-budgets`
+# against it, so a page that starts issuing more SQL than its QUERY_BUDGETS entry (an N+1
+# after a template change, a dropped eager load) fails the test run.
+#
+#   python -m pytest -q test_query_budgets.py
+# ==============================================================================
+
+import os
+import tempfile
+
+scratch_dir = tempfile.mkdtemp(prefix='gym-query-budgets-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(scratch_dir, 'budgets.db')
+
+import pytest  # noqa: E402
+from app import app, generate_gym_data, activity_log_writer  # noqa: E402  (must follow DATABASE_URL)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+@pytest.fixture(scope='module')
+def seeded_app():
+    # Templates sit next to app.py in a flat checkout and under templates/ when deployed
+    if not os.path.isdir(os.path.join(ROOT, 'templates')): app.template_folder = ROOT
+    with app.app_context():
+        generate_gym_data(members=300, trainers=5, classes=12, bookings=2000, waitlist=100, weight_logs=3000,
+                          activity=2000, plans=200, months=6, seed=7)
+    yield app
+    activity_log_writer.flush()
+
+def test_hot_pages_stay_within_query_budgets(seeded_app):
+    result = seeded_app.test_cli_runner().invoke(args=['check-query-budgets', '--include-writes'])
+    assert result.exit_code == 0, result.output
+    checked = {line.split()[1] for line in result.output.splitlines() if line.startswith('ok')}
+    assert set(seeded_app.config['QUERY_BUDGETS']) <= checked, result.output
+
+def test_exceeding_a_budget_fails(seeded_app, monkeypatch):
+    monkeypatch.setitem(seeded_app.config['QUERY_BUDGETS'], 'member_dashboard', 0)
+    result = seeded_app.test_cli_runner().invoke(args=['check-query-budgets'])
+    assert result.exit_code == 1
+    assert any(line.startswith('FAIL') and 'member_dashboard' in line for line in result.output.splitlines())